@@ -0,0 +1,47 @@
+# Python 3.6.1
+"""
+Frames/s of DumpParser with line-by-line parsing versus bulk decoding of the ATOMS blocks.
+Usage: python bench_dump_decode.py [num_atoms] [num_frames]
+"""
+
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+
+from rmdtoolkit.parser import DumpParser
+
+
+def write_dump(path, num_atoms, num_frames):
+    ids = np.arange(1, num_atoms + 1)
+    with open(path, 'w') as dump:
+        for t in range(num_frames):
+            dump.write('ITEM: TIMESTEP\n{}\nITEM: NUMBER OF ATOMS\n{}\n'.format(t * 1000, num_atoms))
+            dump.write('ITEM: BOX BOUNDS pp pp pp\n0.0 100.0\n0.0 100.0\n0.0 100.0\n')
+            dump.write('ITEM: ATOMS id type x y z\n')
+            atoms = np.c_[ids, ids % 2 + 1, np.random.rand(num_atoms, 3) * 100]
+            np.savetxt(dump, atoms, fmt='%d %d %.5f %.5f %.5f')
+
+
+def frames_per_second(path, bulk):
+    with open(path, 'r') as dump:
+        start = time.perf_counter()
+        num_frames = sum(1 for _ in DumpParser(dump).iter_frames(bulk=bulk))
+        return num_frames / (time.perf_counter() - start)
+
+
+def main(num_atoms=100000, num_frames=10):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'bench.dump')
+        write_dump(path, num_atoms, num_frames)
+        line_fps = frames_per_second(path, bulk=False)
+        bulk_fps = frames_per_second(path, bulk=True)
+    print('{} atoms x {} frames'.format(num_atoms, num_frames))
+    print('line-by-line: {:8.2f} frames/s'.format(line_fps))
+    print('bulk:         {:8.2f} frames/s'.format(bulk_fps))
+    print('speedup:      {:8.1f}x'.format(bulk_fps / line_fps))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -1,4 +1,6 @@
 from .base import *
+from .pbc import *
+from .neighbors import *
 from .curvature import *
 from .density import *
 from .rdf import *
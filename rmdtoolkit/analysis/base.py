@@ -3,6 +3,8 @@
 import sys
 import numpy as np
 
+from .pbc import pbc_distances
+
 
 class AnalysisBase(object):
     def __init__(self, coords,
@@ -32,6 +34,16 @@ class AnalysisBase(object):
         self.tell_format = '{ClassName} Processing Frame {Time}'.format(ClassName=self.__class__.__name__,
                                                                         Time='{Time}')
 
+    def __getstate__(self):
+        state = self.__dict__.copy()  # streams do not pickle, workers report to their own sys.stderr/stdout
+        state['err'] = state['out'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.err = self.err or sys.stderr
+        self.out = self.out or sys.stdout
+
     @property
     def box_volume(self):
         if self._box_volume is None:
@@ -67,10 +79,5 @@ class AnalysisBase(object):
 
     @classmethod
     def pbc_dist(cls, origin, coords, box_lengths):
-        diff = np.abs(coords - origin)
-        pdiff = box_lengths - diff
-        mask = diff < box_lengths / 2
-        diff = np.where(mask, diff, pdiff)  # mask'em
-        dist = np.linalg.norm(diff, axis=1)
-        return dist
+        return pbc_distances(origin, coords, box_lengths)
 
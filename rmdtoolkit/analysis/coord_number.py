@@ -1,36 +1,98 @@
 import numpy as np
 
 from .base import AnalysisBase
+from .pbc import MEMORY_BUDGET, pbc_distances, iter_pbc_distances
+from .neighbors import NeighborSearch
 
 
 class CoordNumAnalysis(AnalysisBase):
-    def __init__(self):
+    def __init__(self, max_bytes=MEMORY_BUDGET):
+        """
+        :param max_bytes: int; memory budget of the blocks of distances computed at once without r_max.
+        """
         super().__init__(coords=None)
         self.center_coords = np.array([])
         self.dist_coords = np.array([])
+        self.max_bytes = max_bytes
 
     def coord_number_worker(self, center, cutoff, mode):
-        dist_list = self.dist_pbc(center, self.dist_coords, self.box_lengths)
+        return self.frame_coord_number(np.reshape(center, (1, -1)), self.dist_coords, self.box_lengths, cutoff,
+                                       mode)[0]
+
+    def coord_number(self, cutoff=2.5, mode='poly', r_max=None):
+        """
+        :param r_max: float; only count the points within r_max of a center, found by a neighbor search. Always
+                      cutoff in mode 'hard'; in mode 'poly' the switching function is truncated at r_max.
+        :return: numpy.array; coordination number of every center.
+        """
+        return self.frame_coord_number(self.center_coords, self.dist_coords, self.box_lengths, cutoff, mode, r_max)
+
+    def coord_number_frames(self, center_frames, coord_frames, box_lengths=None, cutoff=2.5, mode='poly',
+                            r_max=None):
+        """
+        Coordination numbers over a stack of frames.
+        :param center_frames: numpy.array, shape=(frames, centers, 3); or an iterable of (centers, 3) arrays.
+        :param coord_frames: numpy.array, shape=(frames, points, 3); or an iterable of (points, 3) arrays.
+        :param box_lengths: numpy.array, shape=(3,) or (frames, 3); the current box_lengths by default.
+        :param r_max: float; only count the points within r_max of a center, e.g. cutoff plus a few switching
+                      widths. See coord_number.
+        :return: numpy.array, shape=(frames, centers)
+        """
+        if box_lengths is None:
+            box_lengths = self.box_lengths
+        coord_numbers = list()
+        for i_frame, (centers, coords) in enumerate(zip(center_frames, coord_frames)):
+            frame_box = box_lengths[i_frame] if np.ndim(box_lengths) > 1 else box_lengths
+            coord_numbers.append(self.frame_coord_number(centers, coords, frame_box, cutoff, mode, r_max))
+        return np.array(coord_numbers)
+
+    def frame_coord_number(self, centers, coords, box_lengths, cutoff, mode, r_max=None):
+        """
+        :return: numpy.array, shape=(centers,); coordination numbers of a frame, see coord_number.
+        """
         if mode == 'hard':
-            coord_num = np.sum(dist_list < cutoff)
-        elif mode == 'poly':
-            coord_num = np.sum(list(map(lambda dist: self.polynomial_coord_num(dist, cutoff), dist_list)))
-        else:
+            r_max = cutoff
+        elif mode != 'poly':
             raise ValueError("{ClassName} Unrecognized mode!".format(ClassName=self.__class__.__name__))
-        return coord_num
 
-    def coord_number(self, cutoff=2.5, mode='poly'):
-        return np.array(list(map(lambda center: self.coord_number_worker(center, cutoff, mode), self.center_coords)))
+        if r_max is not None:
+            i_centers, _, dists = NeighborSearch(coords, box_lengths).query(centers, r_max)
+            if mode == 'hard':
+                return np.bincount(i_centers[dists < cutoff], minlength=len(centers))
+            return np.bincount(i_centers, weights=self.polynomial_coord_num(dists, cutoff, out=dists),
+                               minlength=len(centers))
+
+        coord_numbers = np.empty(len(centers))  # mode 'poly', 'hard' always has r_max
+        for chunk, dists in iter_pbc_distances(centers, coords, box_lengths, max_bytes=self.max_bytes):
+            coord_numbers[chunk] = np.sum(self.polynomial_coord_num(dists, cutoff, out=dists), axis=1)
+        return coord_numbers
 
     @classmethod
     def dist_pbc(cls, origin, coords, box_lengths):
-        dist = np.abs(coords - origin)
-        pdist = box_lengths - dist
-        mask = dist < box_lengths / 2
-        dist = np.where(mask, dist, pdist)
-        return np.linalg.norm(dist, axis=1)
+        return pbc_distances(origin, coords, box_lengths)
 
     # White and Voth, JCTC, 2014 10 3023-3030.
     @classmethod
-    def polynomial_coord_num(cls, d, cutoff, pow1=6, pow2=12, w=0.3):
-        return 1 if d <= cutoff else (1 - ((d - cutoff) / w) ** pow1) / (1 - ((d - cutoff) / w) ** pow2)
+    def polynomial_coord_num(cls, d, cutoff, pow1=6, pow2=12, w=0.3, out=None):
+        """
+        Switching function, 1 within cutoff and (1 - x^pow1) / (1 - x^pow2) with x = (d - cutoff) / w beyond.
+        :param d: float or numpy.array of distances.
+        :param out: numpy.array of floats to write into, may be d itself.
+        :return: float for a float d, numpy.array otherwise.
+        """
+        if np.ndim(d) == 0:
+            return float(cls.polynomial_coord_num(np.array([d], dtype=float), cutoff, pow1, pow2, w)[0])
+        d = np.asarray(d, dtype=float)
+        inside = d <= cutoff
+        x = np.subtract(d, cutoff, out=out)
+        x /= w
+        x_pow1 = x ** pow1
+        if pow2 == 2 * pow1:  # (1 - x^n) / (1 - x^2n) = 1 / (1 + x^n), also at x = 1
+            x_pow1 += 1.
+            s = np.divide(1., x_pow1, out=x)
+        else:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                s = np.divide(1. - x_pow1, 1. - x ** pow2, out=x)
+            s[x_pow1 == 1.] = pow1 / pow2  # the limit at x = 1
+        s[inside] = 1.
+        return s
@@ -1,15 +1,16 @@
 # Python 3.6.1
 
 import numpy as np
+from scipy.interpolate import griddata
 
 from .base import AnalysisBase
 
 
 class CurvatureAnalysis(AnalysisBase):
-    def __init__(self, coords, shape, **kwargs):
+    def __init__(self, coords=None, shape=None, **kwargs):
         """
         :param coords: coords discreetly describing a surface
-        :param shape:
+        :param shape: tuple; shape of the grid of coords, (nv, nu)
         """
         super().__init__(coords, **kwargs)
         self.shape = shape
@@ -18,72 +19,120 @@ class CurvatureAnalysis(AnalysisBase):
         """
         :return: principal curvature 1, principal curvature 2, gaussian curvature, mean curvature
         """
-        ll = len(self.coords)
-        x = self.coords[:, 0].reshape(self.shape)
-        y = self.coords[:, 1].reshape(self.shape)
-        z = self.coords[:, 2].reshape(self.shape)
-
-        # First derivatives
-        x_v, x_u = np.gradient(x)
-        y_v, y_u = np.gradient(y)
-        z_v, z_u = np.gradient(z)
-
-        # Second Derivatives
-        x_vv, x_uv = np.gradient(x_v)
-        x_uv, x_uu = np.gradient(x_u)
-        y_vv, y_uv = np.gradient(y_v)
-        y_uv, y_uu = np.gradient(y_u)
-        z_vv, z_uv = np.gradient(z_v)
-        z_uv, z_uu = np.gradient(z_u)
-
-        # 2D to 1D for convenience
-        x_v = np.reshape(x_v, ll)
-        x_u = np.reshape(x_u, ll)
-        y_v = np.reshape(y_v, ll)
-        y_u = np.reshape(y_u, ll)
-        z_v = np.reshape(z_v, ll)
-        z_u = np.reshape(z_u, ll)
-        x_vv = np.reshape(x_vv, ll)
-        x_uv = np.reshape(x_uv, ll)
-        x_uu = np.reshape(x_uu, ll)
-        y_vv = np.reshape(y_vv, ll)
-        y_uv = np.reshape(y_uv, ll)
-        y_uu = np.reshape(y_uu, ll)
-        z_vv = np.reshape(z_vv, ll)
-        z_uv = np.reshape(z_uv, ll)
-        z_uu = np.reshape(z_uu, ll)
-
-        # Concatenate 1st and 2nd derivatives
-        d1_v = np.c_[x_v, y_v, z_v]
-        d1_u = np.c_[x_u, y_u, z_u]
-        d2_vv = np.c_[x_vv, y_vv, z_vv]
-        d2_uv = np.c_[x_uv, y_uv, z_uv]
-        d2_uu = np.c_[x_uu, y_uu, z_uu]
+        return self.curvature_frames(np.reshape(self.coords, tuple(self.shape) + (3,))[None])[0]
+
+    def curvature_frames(self, surfaces, max_bytes=1 << 22):
+        """
+        Curvatures of a stack of gridded surfaces, the same as curvature() frame by frame.
+        :param surfaces: numpy.array, shape=(frames, nv, nu, 3); or a list of (n, 3) scattered coords, gridded by
+                         grid_surface to self.shape first.
+        :param max_bytes: int; memory budget of the temporary arrays, bounding the frames computed at once.
+        :return: numpy.array, shape=(frames, nv * nu, 4); principal curvatures 1 and 2, gaussian curvature and mean
+                 curvature of every point.
+        """
+        if not isinstance(surfaces, np.ndarray) or surfaces.ndim != 4:
+            surfaces = np.array([self.grid_surface(_, self.shape) for _ in surfaces])
+        num_frames, num_v, num_u = surfaces.shape[:3]
+        curvatures = np.empty((num_frames, num_v * num_u, 4))
+        chunk_frames = max(1, max_bytes // (24 * surfaces[0].nbytes))  # about 24 grids of temporaries per frame
+        for start in range(0, num_frames, chunk_frames):
+            chunk = slice(start, min(start + chunk_frames, num_frames))
+            curvatures[chunk] = self.fundamental_curvatures(surfaces[chunk]).reshape((-1, num_v * num_u, 4))
+        return curvatures
+
+    @classmethod
+    def fundamental_curvatures(cls, surfaces):
+        """
+        :param surfaces: numpy.array, shape=(frames, nv, nu, 3)
+        :return: numpy.array, shape=(frames, nv, nu, 4); see curvature_frames.
+        """
+        # components first, so that every x, y or z grid is contiguous
+        surfaces = np.ascontiguousarray(np.moveaxis(np.asarray(surfaces, dtype=float), -1, 0))
+        # First and second derivatives along the grid axes, of x, y and z at once
+        d1_v, d1_u = np.gradient(surfaces, axis=(2, 3))
+        d2_vv = np.gradient(d1_v, axis=2)
+        d2_uv, d2_uu = np.gradient(d1_u, axis=(2, 3))
 
         # 1st Fundamental Coefficients (E, F, G)
-        e = np.sum(d1_v * d1_v, axis=1)
-        f = np.sum(d1_u * d1_v, axis=1)
-        g = np.sum(d1_u * d1_u, axis=1)
+        e = cls.dot(d1_v, d1_v)
+        f = cls.dot(d1_u, d1_v)
+        g = cls.dot(d1_u, d1_u)
 
         # 2nd Fundamental Coefficients (L, M, N)
-        cross = np.cross(d1_u, d1_v)
-        norm = np.sqrt(np.sum(cross * cross, axis=1))
-        unit = cross / np.c_[norm, norm, norm]
-        l = np.sum(d2_vv * unit, axis=1)
-        m = np.sum(d2_uv * unit, axis=1)
-        n = np.sum(d2_uu * unit, axis=1)
+        unit = cls.cross(d1_u, d1_v)
+        unit /= np.sqrt(cls.dot(unit, unit))
+        l = cls.dot(d2_vv, unit)
+        m = cls.dot(d2_uv, unit)
+        n = cls.dot(d2_uu, unit)
+
+        curvatures = np.empty(surfaces.shape[1:] + (4,))
+        kappa1, kappa2, k, h = (curvatures[..., _] for _ in range(4))
+        # det(first fundamental)
+        det = e * g
+        det -= f * f
 
         # Gaussian Curvature
         # K = det(second fundamental) / det(first fundamental)
-        k = (l * n - m**2) / (e * g - f**2)
+        np.multiply(l, n, out=k)
+        k -= m * m
+        k /= det
 
         # Mean Curvature
         # H = Tr[(second fundamental)(first fundamental inverse)] / 2
-        h2 = np.trace(np.array([[l*g-f*m, -l*f+e*m], [m*g-n*f, -m*f+n*e]]) / (e*g-f**2))
+        h2 = l * g
+        h2 -= 2 * f * m
+        h2 += n * e
+        h2 /= det
 
         # Principle Curvatures
-        diff = np.sqrt(abs(h2 ** 2 - 4 * k))
-        kappa1 = h2 + diff
-        kappa2 = h2 - diff
+        diff = np.abs(h2 * h2 - 4 * k)
+        np.sqrt(diff, out=diff)
+        np.add(h2, diff, out=kappa1)
+        np.subtract(h2, diff, out=kappa2)
+        np.divide(h2, 2, out=h)
+        return curvatures
 
-        return np.vstack([kappa1, kappa2, k, h2 / 2]).T
+    @staticmethod
+    def dot(a, b):
+        """
+        :param a, b: numpy.array, shape=(3, ...); vectors, components first.
+        :return: numpy.array, shape=(...)
+        """
+        out = a[0] * b[0]
+        out += a[1] * b[1]
+        out += a[2] * b[2]
+        return out
+
+    @staticmethod
+    def cross(a, b):
+        """
+        :param a, b: numpy.array, shape=(3, ...); vectors, components first.
+        :return: numpy.array, shape=(3, ...)
+        """
+        out = np.empty_like(a)
+        for i, j, k in ((0, 1, 2), (1, 2, 0), (2, 0, 1)):
+            np.multiply(a[j], b[k], out=out[i])
+            out[i] -= a[k] * b[j]
+        return out
+
+    @classmethod
+    def grid_surface(cls, coords, shape, bounds=None, method='linear'):
+        """
+        Surface z(x, y) on a regular grid from scattered points, e.g. of the head groups of a leaflet.
+        :param coords: numpy.array, shape=(n, 3)
+        :param shape: tuple; (nv, nu) grid points along x and y.
+        :param bounds: numpy.array, shape=(2, 2); x and y ranges of the grid, those of coords by default.
+        :param method: str; see scipy.interpolate.griddata. Grid points out of the hull of the points take the z of
+                       the nearest point.
+        :return: numpy.array, shape=(nv, nu, 3)
+        """
+        coords = np.asarray(coords, dtype=float)
+        if bounds is None:
+            bounds = np.vstack((coords[:, :2].min(axis=0), coords[:, :2].max(axis=0))).T
+        x, y = np.meshgrid(np.linspace(bounds[0][0], bounds[0][1], shape[0]),
+                           np.linspace(bounds[1][0], bounds[1][1], shape[1]), indexing='ij')
+        z = griddata(coords[:, :2], coords[:, 2], (x, y), method=method)
+        holes = np.isnan(z)
+        if holes.any():
+            z[holes] = griddata(coords[:, :2], coords[:, 2], (x[holes], y[holes]), method='nearest')
+        return np.stack((x, y, z), axis=-1)
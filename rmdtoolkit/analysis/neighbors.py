@@ -0,0 +1,95 @@
+# Python 3.6.1
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.spatial import cKDTree
+
+from .pbc import _periodic_lengths
+
+
+class NeighborSearch(object):
+    def __init__(self, coords, box_lengths=None, leafsize=16):
+        """
+        Periodic KD-tree over a set of points, to find the pairs within a cutoff in O(N log N) instead of
+        computing all the distances.
+        :param coords: numpy.array, shape=(n, dims)
+        :param box_lengths: numpy.array, shape=(dims,), or float for a cubic box; None, 0 or inf along
+                            non-periodic dimensions.
+        :param leafsize: int; see scipy.spatial.cKDTree.
+        """
+        coords = np.asarray(coords, dtype=float)
+        self.box_lengths = np.array(_periodic_lengths(box_lengths, coords.shape[-1]))
+        self.coords = self.wrap(coords)
+        self.leafsize = leafsize
+        self.tree = cKDTree(self.coords, leafsize=leafsize,
+                            boxsize=self.box_lengths if self.box_lengths.any() else None)
+
+    def __len__(self):
+        return len(self.coords)
+
+    def wrap(self, coords):
+        """
+        :return: numpy.array; coords moved into [0, box_lengths) along the periodic dimensions.
+        """
+        coords = np.array(coords, dtype=float)
+        for dim, box_length in enumerate(self.box_lengths):
+            if box_length:
+                component = coords[..., dim]
+                np.mod(component, box_length, out=component)
+                component[component >= box_length] = 0.  # rounding of tiny negative values
+        return coords
+
+    def tree_of(self, centers):
+        if isinstance(centers, NeighborSearch):
+            return centers.tree
+        return cKDTree(self.wrap(np.reshape(centers, (-1, self.coords.shape[-1]))), leafsize=self.leafsize,
+                       boxsize=self.box_lengths if self.box_lengths.any() else None)
+
+    def num_centers(self, centers):
+        if isinstance(centers, NeighborSearch):
+            return len(centers)
+        return np.size(centers) // self.coords.shape[-1]
+
+    def query(self, centers, cutoff):
+        """
+        Pairs of a center and a point within cutoff, by minimum-image distance.
+        :param centers: numpy.array, shape=(m, dims), or a NeighborSearch over them.
+        :param cutoff: float
+        :return: (i_centers, i_points, dists); numpy.array each, one entry per pair.
+        """
+        pairs = self.tree_of(centers).sparse_distance_matrix(self.tree, cutoff, output_type='ndarray')
+        return pairs['i'], pairs['j'], pairs['v']
+
+    def query_pairs(self, cutoff):
+        """
+        Pairs of points within cutoff of each other, each pair once.
+        :return: (i, j, dists); numpy.array each, with i < j.
+        """
+        pairs = self.tree.query_pairs(cutoff, output_type='ndarray')
+        i, j = pairs[:, 0], pairs[:, 1]
+        deltas = self.coords[j] - self.coords[i]
+        for dim, box_length in enumerate(self.box_lengths):
+            if box_length:
+                deltas[:, dim] -= box_length * np.rint(deltas[:, dim] / box_length)
+        return i, j, np.sqrt(np.sum(deltas * deltas, axis=1))
+
+    def distance_matrix(self, centers, cutoff):
+        """
+        :return: scipy.sparse.coo_matrix, shape=(m, n); distances of the pairs within cutoff, which are
+                 stored explicitly even when 0.
+        """
+        i, j, dists = self.query(centers, cutoff)
+        return coo_matrix((dists, (i, j)), shape=(self.num_centers(centers), len(self)))
+
+    def count(self, centers, cutoff):
+        """
+        :return: numpy.array, shape=(m,); number of points within cutoff of every center.
+        """
+        i, _, _ = self.query(centers, cutoff)
+        return np.bincount(i, minlength=self.num_centers(centers))
+
+    def nearest(self, centers, k=1):
+        """
+        :return: (dists, indices); the k nearest points of every center, see scipy.spatial.cKDTree.query.
+        """
+        return self.tree.query(self.wrap(centers), k=k)
@@ -0,0 +1,146 @@
+# Python 3.6.1
+
+import numpy as np
+
+MEMORY_BUDGET = 1 << 21  # bytes of temporary arrays a kernel may use at a time; about the L2 cache of a core
+
+
+def minimum_image(vectors, box_lengths, out=None):
+    """
+    Wrap displacement vectors to their minimum image.
+    :param vectors: numpy.array, shape=(..., dims)
+    :param box_lengths: numpy.array, shape=(dims,), or float for a cubic box; None, 0 or inf along
+                        non-periodic dimensions.
+    :param out: numpy.array to write into, may be vectors itself.
+    :return: numpy.array, shape=(..., dims)
+    """
+    vectors = np.asarray(vectors)
+    if out is None:
+        out = np.array(vectors, dtype=np.result_type(vectors, 1.0))
+    elif out is not vectors:
+        out[...] = vectors
+    for dim, box_length in enumerate(_periodic_lengths(box_lengths, out.shape[-1])):
+        if box_length:
+            component = out[..., dim]
+            component -= box_length * np.rint(component / box_length)
+    return out
+
+
+def pbc_displacements(origins, coords, box_lengths, dtype=None, out=None):
+    """
+    Minimum-image vectors from every origin to every point.
+    :param origins: numpy.array, shape=(m, dims) or (dims,)
+    :param coords: numpy.array, shape=(n, dims) or (dims,)
+    :param dtype: numpy.dtype of the result, float32 or float64; from the inputs by default.
+    :param out: numpy.array of the result's shape and dtype to write into.
+    :return: numpy.array, shape=(m, n, dims), without the m or n axis for a single origin or point.
+    """
+    origins, coords, dtype = _as_points(origins, coords, dtype)
+    shape = origins.shape[:-1] + coords.shape[:-1] + coords.shape[-1:]
+    out = _check_out(out, shape, dtype)
+    out[...] = coords - origins.reshape(origins.shape[:-1] + (1,) * (coords.ndim - 1) + origins.shape[-1:])
+    return minimum_image(out, box_lengths, out=out)
+
+
+def pbc_distances(origins, coords, box_lengths, dtype=None, out=None, max_bytes=MEMORY_BUDGET):
+    """
+    Minimum-image distances from every origin to every point, computed in chunks of origins.
+    See pbc_displacements for the parameters.
+    :param max_bytes: int; memory budget of the temporary arrays.
+    :return: numpy.array, shape=(m, n), without the m or n axis for a single origin or point.
+    """
+    origins, coords, dtype = _as_points(origins, coords, dtype)
+    shape = origins.shape[:-1] + coords.shape[:-1]
+    out = _check_out(out, shape, dtype)
+    dims = coords.shape[-1]
+    rows = out.reshape((-1, int(np.prod(coords.shape[:-1])))) if out.size else out.reshape((0, 0))
+    for _ in iter_pbc_distances(origins.reshape((-1, dims)), coords.reshape((-1, dims)), box_lengths,
+                                dtype=dtype, max_bytes=max_bytes, out=rows):
+        pass
+    return out
+
+
+def iter_pbc_distances(origins, coords, box_lengths, dtype=None, max_bytes=MEMORY_BUDGET, out=None, workspace=None):
+    """
+    Yield the minimum-image distances from chunks of origins to every point, so that reductions over them
+    (histograms, sums) never hold all the m x n distances at once.
+    :param origins: numpy.array, shape=(m, dims)
+    :param coords: numpy.array, shape=(n, dims)
+    :param out: numpy.array, shape=(m, n), to write the chunks into; by default a buffer is reused, so each
+                yielded chunk is only valid until the next one.
+    :param workspace: 1-d numpy.array of dtype, of max_bytes; the temporary arrays are taken from it instead of
+                      being allocated, so that repeated calls on small blocks reuse the same memory.
+    :return: generator of (slice of origins, numpy.array of shape (len(slice), n)).
+    """
+    origins, coords, dtype = _as_points(origins, coords, dtype)
+    num_points = max(len(coords), 1)
+    chunk_size = max(1, min(len(origins), max_bytes // (3 * num_points * dtype.itemsize)))
+    block = chunk_size * len(coords)
+    num_blocks = 2 if out is not None else 3  # components and images, and the distances without out
+    if workspace is None or len(workspace) < num_blocks * block or workspace.dtype != dtype:
+        workspace = np.empty(num_blocks * block, dtype=dtype)
+    blocks = [workspace[_ * block:(_ + 1) * block].reshape((chunk_size, len(coords))) for _ in range(num_blocks)]
+    component, images, buffer = blocks if out is None else blocks + [None]
+    columns = np.ascontiguousarray(coords.T)
+    box_lengths = _periodic_lengths(box_lengths, coords.shape[-1])
+
+    for start in range(0, len(origins), chunk_size):
+        chunk = slice(start, min(start + chunk_size, len(origins)))
+        size = chunk.stop - chunk.start
+        dists = out[chunk] if buffer is None else buffer[:size]
+        delta = component[:size]
+        shift = images[:size]
+        for dim, box_length in enumerate(box_lengths):
+            np.subtract(columns[dim], origins[chunk, dim, None], out=delta)
+            if box_length:
+                np.multiply(delta, 1. / box_length, out=shift)
+                np.rint(shift, out=shift)
+                shift *= box_length
+                delta -= shift
+            if dim:
+                delta *= delta
+                dists += delta
+            else:
+                np.multiply(delta, delta, out=dists)
+        np.sqrt(dists, out=dists)
+        yield chunk, dists
+
+
+def pbc_angles(centers, points1, points2, box_lengths, dtype=None, out=None):
+    """
+    Angles points1-centers-points2 with minimum-image vectors, element by element (broadcast).
+    :param centers, points1, points2: numpy.array, shape=(..., dims)
+    :return: numpy.array, shape=(...); in radians.
+    """
+    centers, points1, dtype = _as_points(centers, points1, dtype)
+    points2 = np.asarray(points2, dtype=dtype)
+    v1 = minimum_image(points1 - centers, box_lengths)
+    v2 = minimum_image(points2 - centers, box_lengths)
+    cosines = np.sum(v1 * v2, axis=-1) / np.sqrt(np.sum(v1 * v1, axis=-1) * np.sum(v2 * v2, axis=-1))
+    out = _check_out(out, cosines.shape, dtype)
+    return np.arccos(np.clip(cosines, -1.0, 1.0, out=out), out=out)
+
+
+def _as_points(origins, coords, dtype):
+    origins = np.asarray(origins)
+    coords = np.asarray(coords)
+    dtype = np.dtype(dtype) if dtype is not None else np.result_type(origins, coords, 1.0)
+    return origins.astype(dtype, copy=False), coords.astype(dtype, copy=False), dtype
+
+
+def _check_out(out, shape, dtype):
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+    if out.shape != shape or out.dtype != dtype:
+        raise ValueError("out must be a {Dtype} array of shape {Shape}!".format(Dtype=dtype, Shape=shape))
+    return out
+
+
+def _periodic_lengths(box_lengths, dims):
+    """
+    :return: list of the box length along each dimension, 0 for the non-periodic ones.
+    """
+    if box_lengths is None:
+        return [0.] * dims
+    box_lengths = np.broadcast_to(np.asarray(box_lengths, dtype=float), (dims,))
+    return [float(_) if np.isfinite(_) and _ > 0 else 0. for _ in box_lengths]
@@ -1,13 +1,29 @@
 # Python 3.6.1
 
+import os
+import copy
+import itertools
+import collections
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
 from .base import AnalysisBase
+from .pbc import MEMORY_BUDGET, pbc_distances, iter_pbc_distances
+from .neighbors import NeighborSearch
 
 
 class RDFAnalysis(AnalysisBase):
-    def __init__(self, hist_range=(0., 20.), hist_bins=400, rho=None, **kwargs):
+    def __init__(self, hist_range=(0., 20.), hist_bins=400, rho=None, cutoff=None, max_bytes=MEMORY_BUDGET,
+                 **kwargs):
+        """
+        :param cutoff: float; only count the pairs within cutoff, found by a neighbor search instead of computing
+                       all the distances. hist_range[1] gives the same RDF at a fraction of the cost.
+                       'auto' does so whenever hist_range[1] is under half the box.
+        :param max_bytes: int; memory budget of the blocks of distances computed at once without a cutoff.
+        """
         super().__init__(coords=None, **kwargs)
+        self.cutoff = cutoff
+        self.max_bytes = max_bytes
 
         self.n_frame = 0
         self.n_center = None
@@ -35,18 +51,254 @@ class RDFAnalysis(AnalysisBase):
         if self.bin_edges is None:
             self.bin_edges = np.histogram([0], bins=self.hist_bins, range=self.hist_range)[1]
 
-        hists = np.array(list(map(lambda x: np.histogram(self.dist_pbc(x, particles, self.box_lengths),
-                                                         bins=self.hist_bins, range=self.hist_range)[0],
-                                  centers)))
-        self.hist += np.sum(hists, axis=0)
+        cutoff = self.neighbor_cutoff()
+        if cutoff is not None:
+            _, _, dists = NeighborSearch(particles, self.box_lengths).query(centers, cutoff)
+            self.hist += self.bin_counts(dists, overwrite=True)
+            return
+        self.hist += self.block_counts(centers, particles)
+
+    def neighbor_cutoff(self):
+        """
+        :return: float, the cutoff of the neighbor search to use, or None to compute all the distances.
+        """
+        if self.cutoff == 'auto':
+            return self.hist_range[1] if self.hist_range[1] < np.min(self.box_lengths) / 2 else None
+        return self.cutoff
+
+    def rdf_parallel(self, frames, workers=None, chunk_frames=64):
+        """
+        Accumulate frames in worker processes, each into a partial RDF, merged in frame order. The counts are the
+        same as calling rdf() on every frame in turn.
+        :param frames: iterable of (centers, particles) or (centers, particles, box_lengths); box_lengths default
+                       to the current ones. (coords, types) for PartialRDFAnalysis, see rdf_types.
+        :param workers: int; number of worker processes, os.cpu_count() by default.
+        :param chunk_frames: int; number of frames per task.
+        :return: self
+        """
+        workers = workers or os.cpu_count()
+        frames = iter(frames)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = collections.deque()
+            while True:
+                chunk = [tuple(_) for _ in itertools.islice(frames, chunk_frames)]
+                if chunk:
+                    pending.append(executor.submit(_rdf_frames, self.partial(), chunk))
+                if pending and (not chunk or len(pending) >= 2 * workers):  # bound the frames held in memory
+                    self.merge(pending.popleft().result())
+                elif not chunk:
+                    break
+        return self
+
+    def partial(self):
+        """
+        :return: RDFAnalysis with the settings of this one and no frames, to accumulate frames apart and merge().
+        """
+        partial = copy.copy(self)
+        partial.n_frame = 0
+        partial.hist = np.zeros_like(self.hist)
+        return partial
+
+    def merge(self, other):
+        """
+        Add the frames of another RDFAnalysis, accumulated after the frames of this one, before normalize_rdf().
+        :param other: RDFAnalysis with the same bins and number of centers.
+        :return: self
+        """
+        if other.hist_bins != self.hist_bins or tuple(other.hist_range) != tuple(self.hist_range):
+            raise ValueError("{ClassName} Cannot merge different bins!".format(ClassName=self.__class__.__name__))
+        if other.n_frame == 0:
+            return self
+        if self.n_center is not None and not np.array_equal(other.n_center, self.n_center):
+            raise ValueError("{ClassName}.n_center is not consistent!".format(ClassName=self.__class__.__name__))
+        if self.n_frame == 0:
+            self.n_center = other.n_center
+            self.rho = other.rho if self.rho is None else self.rho
+            self.bin_edges = other.bin_edges
+        self.n_frame += other.n_frame
+        self.hist += other.hist
+        return self
+
+    def block_counts(self, centers, particles):
+        """
+        :return: numpy.array of int, shape=(hist_bins,); histogram of the distances from every center to every
+                 particle, computed in blocks of max_bytes.
+        """
+        counts = np.zeros(self.hist_bins, dtype=np.int64)
+        for _, dists in iter_pbc_distances(centers, particles, self.box_lengths, max_bytes=self.max_bytes):
+            counts += self.bin_counts(dists, overwrite=True)
+        return counts
+
+    def bin_counts(self, dists, overwrite=False):
+        """
+        Histogram of dists over the bins through numpy.bincount.
+        :param dists: numpy.array
+        :param overwrite: bool; dists may be overwritten, to bin them without a temporary array.
+        :return: numpy.array of int, shape=(hist_bins,)
+        """
+        indices = self.bin_indices(dists, out=dists if overwrite else None)
+        return np.bincount(indices.ravel(), minlength=self.hist_bins + 1)[:-1]
+
+    def bin_indices(self, dists, out=None):
+        """
+        Bin k holds hist_range[0] + k * bin_size <= d < hist_range[0] + (k + 1) * bin_size, up to rounding;
+        unlike numpy.histogram, hist_range[1] itself is out of range.
+        :param dists: numpy.array
+        :param out: numpy.array of floats of the shape of dists to compute in, may be dists itself.
+        :return: numpy.array of int, the shape of dists; bin of every distance, hist_bins for those out of
+                 hist_range.
+        """
+        lower, upper = self.hist_range
+        inv_width = self.hist_bins / (upper - lower)
+        scaled = np.multiply(dists, inv_width, out=out)
+        scaled -= lower * inv_width
+        np.floor(scaled, out=scaled)
+        np.clip(scaled, -1, self.hist_bins, out=scaled)  # below the range to -1, above to the overflow bin
+        indices = scaled.astype(np.intp)
+        indices[indices < 0] = self.hist_bins
+        return indices
 
     def normalize_rdf(self):
         self.hist /= 4 * np.pi * self.bin_edges[1:] ** 2 * self.bin_size * self.rho * self.n_center * self.n_frame
 
     @classmethod
     def dist_pbc(cls, origin, coords, box_lengths):
-        dist = np.abs(coords - origin)
-        pdist = box_lengths - dist
-        mask = dist < box_lengths / 2
-        dist = np.where(mask, dist, pdist)
-        return np.linalg.norm(dist, axis=1)
+        return pbc_distances(origin, coords, box_lengths)
+
+
+class PartialRDFAnalysis(RDFAnalysis):
+    def __init__(self, pairs, **kwargs):
+        """
+        Partial RDFs of several pairs of species, all filled from a single distance computation per frame.
+        n_center, rho and every row of hist are per pair.
+        :param pairs: list of (center species, particle species); e.g. [('O', 'O'), ('O', 'H'), ('OH3', 'O')].
+        See RDFAnalysis for the other parameters.
+        """
+        super().__init__(**kwargs)
+        self.pairs = [tuple(_) for _ in pairs]
+        self.species = sorted(set(itertools.chain.from_iterable(self.pairs)))
+        self.hist = np.zeros((len(self.pairs), self.hist_bins))
+
+        # species code of the centers x species code of the particles -> pair, len(pairs) for none
+        self._pair_table = np.full((len(self.species), len(self.species)), len(self.pairs), dtype=np.intp)
+        for i_pair, (center, particle) in enumerate(self.pairs):
+            self._pair_table[self.species.index(center), self.species.index(particle)] = i_pair
+
+    def rdf(self, centers, particles):
+        raise NotImplementedError("{ClassName} Use rdf_types() with the species of all the atoms.".format(
+            ClassName=self.__class__.__name__))
+
+    def rdf_types(self, coords, types):
+        """
+        :param coords: numpy.array, shape=(n, 3); all the atoms of a frame.
+        :param types: numpy.array, shape=(n,); species label of every atom, as in pairs.
+        """
+        self.n_frame += 1
+
+        types = np.asarray(types)
+        codes = np.full(len(types), -1, dtype=np.intp)
+        for code, species in enumerate(self.species):
+            codes[types == species] = code
+        counts = np.bincount(codes[codes >= 0], minlength=len(self.species))
+        centers_of, particles_of = np.array([[self.species.index(_) for _ in pair] for pair in self.pairs]).T
+
+        if self.n_center is None:
+            self.n_center = counts[centers_of]
+        elif not np.array_equal(counts[centers_of], self.n_center):
+            raise ValueError("{ClassName}.n_center is not consistent!".format(ClassName=self.__class__.__name__))
+
+        if self.rho is None:
+            self.rho = counts[particles_of] / self.box_volume
+
+        if self.bin_edges is None:
+            self.bin_edges = np.histogram([0], bins=self.hist_bins, range=self.hist_range)[1]
+
+        # each distance between two atoms of the pairs is computed once and counted from both of its ends
+        cutoff = self.neighbor_cutoff()
+        if cutoff is not None:
+            atoms = np.flatnonzero(codes >= 0)
+            i, j, dists = NeighborSearch(coords[atoms], self.box_lengths).query_pairs(cutoff)
+            self.hist += self.pair_bin_counts(codes[atoms][i], codes[atoms][j], dists)
+            # and every atom is at distance 0 from itself, as with the same centers and particles in RDFAnalysis
+            zero_bin = self.bin_indices(np.zeros(1))[0]
+            if zero_bin < self.hist_bins:
+                same = centers_of == particles_of
+                self.hist[same, zero_bin] += counts[centers_of[same]]
+            return
+
+        atoms = np.argsort(codes, kind='stable')[len(codes) - np.sum(counts):]
+        grouped = coords[atoms]  # by species, so that every species is a slice
+        bounds = np.append(0, np.cumsum(counts))
+        table = self._pair_table
+        for code_a, code_b in itertools.combinations_with_replacement(range(len(self.species)), 2):
+            i_pairs = {table[code_a, code_b], table[code_b, code_a]} - {len(self.pairs)}
+            if i_pairs:
+                pair_counts = self.species_counts(grouped, bounds, code_a, code_b)
+                for i_pair in i_pairs:
+                    self.hist[i_pair] += pair_counts
+
+    def species_counts(self, coords, bounds, code_a, code_b):
+        """
+        Histogram of the distances between the atoms of species code_a and those of species code_b.
+        :param coords: numpy.array, shape=(n, 3); the atoms of the pairs, grouped by species.
+        :param bounds: numpy.array of int; the atoms of species code are coords[bounds[code]:bounds[code + 1]].
+        :return: numpy.array of int, shape=(hist_bins,); within a species every distance counts from both of its
+                 ends, and every atom once at distance 0 from itself.
+        """
+        first, last = bounds[code_a], bounds[code_a + 1]
+        if code_a != code_b:
+            return self.block_counts(coords[first:last], coords[bounds[code_b]:bounds[code_b + 1]])
+
+        # within the species, blocks of rows against themselves and the rows after them: the pairs after the block
+        # count from both ends, those within it already do
+        counts = np.zeros(self.hist_bins, dtype=np.int64)
+        workspace = np.empty(self.max_bytes // coords.itemsize, dtype=coords.dtype)  # shared by the blocks
+        start = first
+        while start < last:
+            stop = min(start + max(1, self.max_bytes // (3 * (last - start) * coords.itemsize)), last)
+            for _, dists in iter_pbc_distances(coords[start:stop], coords[start:last], self.box_lengths,
+                                               max_bytes=self.max_bytes, workspace=workspace):
+                indices = self.bin_indices(dists, out=dists)
+                counts += 2 * np.bincount(indices.ravel(), minlength=self.hist_bins + 1)[:-1]
+                counts -= np.bincount(indices[:, :stop - start].ravel(), minlength=self.hist_bins + 1)[:-1]
+            start = stop
+        return counts
+
+    def pair_bin_counts(self, codes_i, codes_j, dists):
+        """
+        :param codes_i, codes_j: numpy.array of int, broadcast to the shape of dists; species codes of both ends.
+        :param dists: numpy.array; distances of unordered pairs of atoms.
+        :return: numpy.array of int, shape=(len(pairs), hist_bins); histograms of all the pairs, counting every
+                 distance for the pair centered on either end.
+        """
+        indices = self.bin_indices(dists)
+        size = (len(self.pairs) + 1) * (self.hist_bins + 1)
+        counts = np.bincount((self._pair_table[codes_i, codes_j] * (self.hist_bins + 1) + indices).ravel(),
+                             minlength=size)
+        counts += np.bincount((self._pair_table[codes_j, codes_i] * (self.hist_bins + 1) + indices).ravel(),
+                              minlength=size)
+        return counts.reshape((len(self.pairs) + 1, self.hist_bins + 1))[:-1, :-1]
+
+    def pair_hist(self, center, particle):
+        """
+        :return: numpy.array, shape=(hist_bins,); the histogram, or RDF once normalized, of a pair.
+        """
+        return self.hist[self.pairs.index((center, particle))]
+
+    def normalize_rdf(self):
+        shell_volumes = 4 * np.pi * self.bin_edges[1:] ** 2 * self.bin_size
+        self.hist /= shell_volumes * (self.rho * self.n_center * self.n_frame)[:, None]
+
+
+def _rdf_frames(analysis, frames):
+    """
+    Worker of RDFAnalysis.rdf_parallel: accumulate frames into a partial RDF.
+    """
+    for frame in frames:
+        if len(frame) > 2:
+            analysis.box_lengths = frame[2]
+        if isinstance(analysis, PartialRDFAnalysis):
+            analysis.rdf_types(frame[0], frame[1])
+        else:
+            analysis.rdf(frame[0], frame[1])
+    return analysis
@@ -4,6 +4,9 @@ import numpy as np
 import itertools
 from collections import defaultdict
 
+from ..analysis.pbc import minimum_image, pbc_distances, pbc_angles
+from ..analysis.neighbors import NeighborSearch
+
 
 class HydComp(object):
     def __init__(self, directed=False):
@@ -28,6 +31,22 @@ class HydComp(object):
         for node1, node2 in connections:
             self.add_connection(node1, node2)
 
+    def connect_within(self, cutoff):
+        """
+        Connect every pair of o_coords closer than cutoff, found by a periodic neighbor search.
+        """
+        i, j, _ = NeighborSearch(self.o_coords, self.box_len).query_pairs(cutoff)
+        self.add_connections(zip(i.tolist(), j.tolist()))
+
+    def allocate_hydrogens(self):
+        """
+        Set h_alloc: the indices of the h_coords whose nearest O is each of o_coords.
+        """
+        _, nearest = NeighborSearch(self.o_coords, self.box_len).nearest(self.h_coords)
+        order = np.argsort(nearest, kind='stable')
+        self.h_alloc = np.empty(len(self.o_coords), dtype=object)
+        self.h_alloc[:] = np.split(order, np.searchsorted(nearest[order], np.arange(1, len(self.o_coords))))
+
     def is_connected(self, node1, node2):
         return node1 in self.graph and node2 in self.graph[node1]
 
@@ -80,10 +99,8 @@ class HydComp(object):
                     o_coord2 = self.o_coords[int(outer)]
                     h_coords = self.h_coords[np.append(self.h_alloc[int(inner)], self.h_alloc[int(outer)])]
 
-                    ds = np.abs(np.array(list(map(lambda _: self.dist_pbc(origin=o_coord1, coord=_,
-                                                                          box_lengths=self.box_len), h_coords)))
-                                - np.array(list(map(lambda _: self.dist_pbc(origin=o_coord2, coord=_,
-                                                                            box_lengths=self.box_len), h_coords))))
+                    ds = np.abs(pbc_distances(o_coord1, h_coords, self.box_len)
+                                - pbc_distances(o_coord2, h_coords, self.box_len))
                     doo = self.dist_pbc(o_coord1, o_coord2, self.box_len)
                     doos.append(doo)
                     deltas.append(min(ds))
@@ -112,10 +129,8 @@ class HydComp(object):
                     o_coord2 = self.o_coords[int(outer)]
                     h_coords = self.h_coords[np.append(self.h_alloc[int(inner)], self.h_alloc[int(outer)])]
 
-                    ds = np.abs(np.array(list(map(lambda _: self.dist_pbc(origin=o_coord1, coord=_,
-                                                                          box_lengths=self.box_len), h_coords)))
-                                - np.array(list(map(lambda _: self.dist_pbc(origin=o_coord2, coord=_,
-                                                                            box_lengths=self.box_len), h_coords))))
+                    ds = np.abs(pbc_distances(o_coord1, h_coords, self.box_len)
+                                - pbc_distances(o_coord2, h_coords, self.box_len))
                     shared_h_coord = h_coords[np.argmin(ds)]
                     angle = self.angle_between(shared_h_coord, o_coord1, o_coord2, box_lengths=self.box_len)
 
@@ -138,18 +153,15 @@ class HydComp(object):
         if wat_o_coords.size == 0:
             return np.nan, np.nan, np.nan
 
-        dist_oo = np.array(list(map(lambda _: self.dist_pbc(origin=hyd_o_coord, coord=_, box_lengths=self.box_len),
-                                    wat_o_coords)))
+        dist_oo = pbc_distances(hyd_o_coord, wat_o_coords, self.box_len)
         arg = np.argmin(dist_oo)
         doo = dist_oo[arg]
         wat = wats[arg]
         wat_o_coord = wat_o_coords[arg]
 
         h_coords = self.h_coords[np.append(self.h_alloc[int(hyd)], self.h_alloc[int(wat)])]
-        dist_oh = np.array(list(map(lambda _: self.dist_pbc(origin=hyd_o_coord, coord=_, box_lengths=self.box_len),
-                                    h_coords))) \
-            + np.array(list(map(lambda _: self.dist_pbc(origin=wat_o_coord, coord=_, box_lengths=self.box_len),
-                                h_coords)))
+        dist_oh = pbc_distances(hyd_o_coord, h_coords, self.box_len) \
+            + pbc_distances(wat_o_coord, h_coords, self.box_len)
         shared_h_coord = h_coords[np.argmin(dist_oh)]
 
         angle = self.angle_between(shared_h_coord, wat_o_coord, hyd_o_coord, box_lengths=self.box_len)
@@ -169,10 +181,8 @@ class HydComp(object):
         for wat in wats:
             wat_o_coord = self.o_coords[int(wat)]
             h_coords = self.h_coords[np.append(self.h_alloc[int(hyd)], self.h_alloc[int(wat)])]
-            dist = np.array(list(map(lambda _: self.dist_pbc(origin=hyd_o_coord, coord=_, box_lengths=self.box_len),
-                                     h_coords))) \
-                + np.array(list(map(lambda _: self.dist_pbc(origin=wat_o_coord, coord=_, box_lengths=self.box_len),
-                                    h_coords)))
+            dist = pbc_distances(hyd_o_coord, h_coords, self.box_len) \
+                + pbc_distances(wat_o_coord, h_coords, self.box_len)
             shared_h_coord = h_coords[np.argmin(dist)]
 
             delta = np.abs(self.dist_pbc(origin=shared_h_coord, coord=hyd_o_coord, box_lengths=self.box_len) -
@@ -184,7 +194,7 @@ class HydComp(object):
         hyd = self.node_list[np.where(self.shell_list == 0)]
         o_coord = self.o_coords[int(hyd)]
         h_coords = self.h_coords[self.h_alloc[int(hyd)]]
-        h_coords = np.array(list(map(lambda coord: self.vec_pbc(o_coord, coord, self.box_len), h_coords)))
+        h_coords = self.vec_pbc(o_coord, h_coords, self.box_len)
         dipole = np.array([0, 0, 0]) - np.sum(h_coords, axis=0) / 3
         return dipole
 
@@ -202,23 +212,12 @@ class HydComp(object):
 
     @classmethod
     def dist_pbc(cls, origin, coord, box_lengths):
-        dist = np.abs(coord - origin)
-        pdist = box_lengths - dist
-        mask = dist < box_lengths / 2
-        dist = np.where(mask, dist, pdist)
-        return np.linalg.norm(dist)
+        return pbc_distances(origin, coord, box_lengths)[()]
 
     @classmethod
     def vec_pbc(cls, origin, coord, box_lengths):
-        vec = coord - origin
-        pvec = vec - box_lengths * np.sign(vec)
-        mask = abs(vec) < box_lengths / 2
-        return np.where(mask, vec, pvec)
+        return minimum_image(np.asarray(coord) - origin, box_lengths)
 
     @classmethod
     def angle_between(cls, c, p1, p2, box_lengths):
-        v1 = cls.vec_pbc(c, p1, box_lengths)
-        v2 = cls.vec_pbc(c, p2, box_lengths)
-        v1_u = v1 / np.linalg.norm(v1)
-        v2_u = v2 / np.linalg.norm(v2)
-        return np.arccos(np.clip(np.dot(v1_u, v2_u), -1.0, 1.0))
+        return pbc_angles(c, p1, p2, box_lengths)[()]
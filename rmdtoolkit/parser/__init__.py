@@ -1,6 +1,12 @@
 from .base import *
+from .compressed import *
+from .frame_index import *
+from .frames import *
+from .column_table import *
 from .evb_parser import *
 from .lammps_parser import *
 from .xyz_parser import *
 from .pdb_parser import *
 from .colvar_parser import *
+from .trajectory import *
+from .trajectory_cache import *
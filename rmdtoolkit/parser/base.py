@@ -1,9 +1,24 @@
 # Python 3.6.1
 
+import io
+import os
 import sys
+import mmap
+import queue
+import threading
+import itertools
+import collections
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from .frame_index import FrameIndex
+from .compressed import open_binary
 
 
 class ParserBase(object):
+    frame_marker = None  # bytes; the line every frame starts with, used by the frame index
+    time_pattern = None  # bytes; regex capturing the timestep at the start of a frame
+
     def __init__(self, file,
                  tell_time=False, tell_freq=100,
                  err=sys.stderr, out=sys.stdout):
@@ -17,6 +32,12 @@ class ParserBase(object):
         self.last_pos = int()  # last offset of file
         self.current_pos = int()  # current offset of file
         self.frame_time = int()
+        self.frame_index = None
+        self._mmap = None
+        self._line_size = 64  # estimated bytes per line, used to read blocks of lines at once
+        self._frame_size = 1 << 16  # estimated bytes per frame, used to read frames at once
+        self._frames_read = 0  # frames read by the raw frame iterators, parsed or skipped
+        self._frames_counted = 0  # frames of those passed to count_frames()
 
         self.tell_time = tell_time
         self.tell_freq = tell_freq
@@ -46,6 +67,428 @@ class ParserBase(object):
     def parse_file(self, **kwargs):
         raise NotImplementedError("Override this function in each subclass.")
 
+    def count_frames(self, num_frames):
+        """
+        Called by iter_frames with the number of frames read since the last call, parsed or skipped, before a frame
+        is parsed and when the iteration ends. Parsers of formats without timesteps count frame_time with it.
+        """
+        pass
+
+    def iter_frames(self, start=0, stop=None, stride=1, use_mmap=False, raw=False, prefetch=0, **kwargs):
+        """
+        Parse frame by frame, yielding each parsed frame without keeping it.
+        Frames are counted from the current position of the file.
+        :param start: int; the first frame to parse.
+        :param stop: int; the frame to stop before, None to parse till the end of the file.
+        :param stride: int; parse every stride-th frame from start on.
+        :param use_mmap: bool; map the file into memory and decode frames from slices of it.
+        :param raw: bool; read frames as raw bytes from the binary stream under the file, if it has one,
+                    and decode them with decode_frame().
+        :param prefetch: int; read up to prefetch raw frames ahead in a background thread while the frames
+                         before are decoded. Implies raw.
+        :param kwargs: passed to parse_frame() or decode_frame().
+        """
+        stream = None
+        self._frames_read = self._frames_counted = 0
+        if use_mmap:
+            buffers = self.iter_frame_buffers(start=start, stop=stop, stride=stride)
+        else:
+            stream = self.raw_stream() if raw or prefetch else None
+            if stream is None:
+                yield from self.iter_parsed_frames(start=start, stop=stop, stride=stride, **kwargs)
+                return
+            buffers = self.iter_stream_buffers(stream, start=start, stop=stop, stride=stride)
+        if prefetch:
+            buffers = self.prefetch_buffers(buffers, prefetch, stream=stream)
+
+        try:
+            yield from self.decode_frames(buffers, frames=itertools.count(start, stride), **kwargs)
+        finally:
+            buffers.close()
+            self.count_frames(self._frames_read - self._frames_counted)
+            if stream is not None:
+                self.sync_stream(stream)
+
+    def iter_parsed_frames(self, start=0, stop=None, stride=1, **kwargs):
+        """
+        Parse frame by frame with read_frame() and parse_frame(), see iter_frames.
+        """
+        i_frame = 0
+        while stop is None or i_frame < stop:
+            status = self.read_frame()
+            if status == 1 and not self.frame:
+                break
+            self.count_frames(1)
+            if i_frame >= start and (i_frame - start) % stride == 0:
+                self.parse_frame(**kwargs)
+                self.time_tell()
+                yield self.frame_json
+            if status == 1:
+                break
+            i_frame += 1
+
+    def iter_frames_parallel(self, start=0, stop=None, stride=1, workers=None, chunk_frames=None, **kwargs):
+        """
+        Parse frames in worker processes, yielding them in file order. Frames are decoded exactly as with
+        decode_frame(), from frame-aligned byte ranges given by the frame index (built if needed).
+        :param workers: int; number of worker processes, os.cpu_count() by default.
+        :param chunk_frames: int; number of frames decoded per task. Every task opens the file anew, so larger
+                             tasks pay off for compressed files, which are inflated up to the first frame.
+        See iter_frames for the other parameters.
+        """
+        if self.frame_index is None:
+            self.build_index()
+        first = int(np.searchsorted(self.frame_index.offsets, self.file.tell()))
+        frames = range(first, len(self.frame_index))[start:stop:stride]
+        workers = workers or os.cpu_count()
+        chunk_frames = chunk_frames or max(1, min(256, -(-len(frames) // (4 * workers))))
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = collections.deque()
+            for i in range(0, len(frames), chunk_frames):
+                ranges = [self.frame_index.frame_range(_) for _ in frames[i:i+chunk_frames]]
+                pending.append(executor.submit(_decode_ranges, self.__class__, self.frame_index.path, ranges, kwargs))
+                self.current_pos = ranges[-1][1]
+                if len(pending) >= 2 * workers:  # bound the decoded frames held in memory
+                    yield from self._collect_frames(pending.popleft().result())
+            while pending:
+                yield from self._collect_frames(pending.popleft().result())
+        if frames:
+            self.file.seek(self.current_pos)
+
+    def _collect_frames(self, frame_jsons):
+        for frame_json in frame_jsons:
+            self.frame_json = frame_json
+            self.frame_time = frame_json["time"]
+            self.time_tell()
+            yield frame_json
+
+    def decode_frames(self, buffers, frames=None, **kwargs):
+        """
+        Decode raw frames one by one, yielding each parsed frame.
+        :param buffers: iterable of bytes-like frames.
+        :param frames: iterable of int; number of each frame in buffers, counted from 0 where the reading started.
+                       The frames read up to each are passed to count_frames() before it is decoded.
+        :param kwargs: passed to decode_frame().
+        """
+        frames = itertools.count() if frames is None else frames
+        for i_frame, buf in zip(frames, buffers):
+            self.count_frames(i_frame + 1 - self._frames_counted)
+            self._frames_counted = i_frame + 1
+            self.decode_frame(buf, **kwargs)
+            self.time_tell()
+            yield self.frame_json
+
+    def prefetch_buffers(self, buffers, depth, stream=None):
+        """
+        Pull raw frames from buffers in a background thread, keeping up to depth frames ready in a queue.
+        memoryview frames are copied to bytes in the thread, so their pages are read there.
+        If the frames are not all taken, the frames read ahead are given back: the file, or stream, is moved back
+        to the end of the last frame taken.
+        :param buffers: generator of iter_stream_buffers() or iter_frame_buffers().
+        :param stream: the binary stream read by buffers, None for the mapped file.
+        """
+        frames = queue.Queue(maxsize=depth)
+        stopped = threading.Event()
+        end = object()
+
+        def tell():
+            return stream.tell() if stream is not None else self.current_pos, self._frames_read
+
+        def read():
+            try:
+                for buf in buffers:
+                    if isinstance(buf, memoryview):
+                        buf = bytes(buf)
+                    item = buf, tell()
+                    while not stopped.is_set():
+                        try:
+                            frames.put(item, timeout=0.1)
+                            break
+                        except queue.Full:
+                            pass
+                    if stopped.is_set():
+                        break
+            except Exception as error:
+                frames.put(error)
+            finally:
+                buffers.close()
+            frames.put(end)
+
+        taken = (stream.tell() if stream is not None else self.file.tell()), self._frames_read
+        finished = False
+        reader = threading.Thread(target=read, daemon=True)
+        reader.start()
+        try:
+            while True:
+                item = frames.get()
+                if item is end:
+                    finished = True
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                buf, taken = item
+                yield buf
+        finally:
+            stopped.set()
+            while reader.is_alive():  # unblock the reader
+                try:
+                    frames.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            reader.join()
+            if not finished:  # give back the frames read ahead
+                pos, self._frames_read = taken
+                if stream is not None:
+                    stream.seek(pos)
+                else:
+                    self.current_pos = pos
+                    self.file.seek(pos)
+
+    def iter_stream_buffers(self, stream, start=0, stop=None, stride=1):
+        """
+        Read frames from a binary stream, yielding the selected ones as bytes.
+        """
+        i_frame = 0
+        while stop is None or i_frame < stop:
+            buf = self.read_frame_bytes(stream)
+            if not buf:
+                break
+            self._frames_read = i_frame + 1
+            if i_frame >= start and (i_frame - start) % stride == 0:
+                yield buf
+            i_frame += 1
+
+    def read_frame_bytes(self, stream):
+        """
+        Read the next frame from a binary stream, up to the next line starting with frame_marker.
+        :param stream: binary file object positioned at the start of a frame.
+        :return: bytes of the frame, empty at the end of the file.
+        """
+        if self.frame_marker is None:
+            raise NotImplementedError("Override this function in subclasses without frame marker.")
+        needle = b'\n' + self.frame_marker
+        buf = b''
+        size = self._frame_size
+        while True:
+            chunk = stream.read(size)
+            searched = max(len(buf) - len(needle) + 1, 0)  # the needle may straddle the chunks
+            buf += chunk
+            end = buf.find(needle, searched)
+            if end != -1:  # went past the frame, give the rest back
+                stream.seek(end + 1 - len(buf), 1)
+                buf = buf[:end+1]
+                break
+            if not chunk:
+                break
+            size *= 2
+        self._frame_size = int(len(buf) * 1.1) + 4096
+        return buf
+
+    def read_lines_bytes(self, stream, num_lines):
+        """
+        :return: bytes of the next num_lines lines of a binary stream, read in one go.
+        """
+        if num_lines == 0:
+            return b''
+        block = stream.read(int(num_lines * self._line_size) + 4096)
+        count = block.count(b'\n')
+        while count < num_lines:
+            line_size = len(block) / max(count, 1)
+            more = stream.read(int((num_lines - count) * line_size * 1.1) + 4096)
+            if not more:
+                break
+            count += more.count(b'\n')
+            block += more
+        if count > num_lines:  # went past the block, give the rest back
+            end = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord('\n'))[num_lines-1] + 1
+            stream.seek(int(end) - len(block), 1)
+            block = block[:end]
+        self._line_size = len(block) / num_lines
+        return block
+
+    def map_file(self):
+        """
+        :return: read-only mmap of the whole file, mapped again if the size of the file changed since.
+        """
+        try:
+            fileno = self.file.fileno()
+            if self._mmap is not None and len(self._mmap) != os.fstat(fileno).st_size:
+                self.unmap_file()
+            if self._mmap is None:
+                self._mmap = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+            raise ValueError("{ClassName} Only files on disk can be memory-mapped!".format(
+                ClassName=self.__class__.__name__))
+        return self._mmap
+
+    def unmap_file(self):
+        """
+        Drop the mmap of the file. A map still sliced by memoryviews is unmapped once they are released.
+        """
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass
+            self._mmap = None
+
+    def close(self):
+        """
+        Unmap and close the file.
+        """
+        self.unmap_file()
+        if self.file is not None:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def iter_frame_buffers(self, start=0, stop=None, stride=1):
+        """
+        Map the file into memory and yield the selected frames as memoryview slices of it, without copying.
+        Frames are counted from the current position of the file. With a frame index, skipped frames are not read.
+        """
+        view = memoryview(self.map_file())
+        self.current_pos = self.file.tell()
+        i_frame = 0
+        try:
+            while (stop is None or i_frame < stop) and self.current_pos < len(view):
+                buf = self.next_frame_buffer(view)
+                self._frames_read = i_frame + 1
+                if i_frame >= start and (i_frame - start) % stride == 0:
+                    yield buf
+                i_frame += 1
+        finally:
+            self.file.seek(self.current_pos)
+
+    def next_frame_buffer(self, view):
+        """
+        :param view: memoryview of the mapped file.
+        :return: memoryview of the frame at the current offset.
+        """
+        self.last_pos = self.current_pos
+        self.current_pos = self.find_frame_end(self.current_pos)
+        return view[self.last_pos:self.current_pos]
+
+    def find_frame_end(self, start):
+        """
+        :return: offset where the frame starting at offset start ends in the mapped file.
+        """
+        if self.frame_index is not None:
+            offsets = self.frame_index.offsets
+            i = np.searchsorted(offsets, start, side='right')
+            if 0 < i < len(offsets) and offsets[i-1] == start:
+                return int(offsets[i])
+        if self.frame_marker is None:
+            raise NotImplementedError("Override this function in subclasses without frame marker.")
+        end = self._mmap.find(b'\n' + self.frame_marker, start)
+        return end + 1 if end != -1 else len(self._mmap)
+
+    def skip_lines(self, start, num_lines, window=1 << 20, buf=None):
+        """
+        :param buf: bytes-like to skip lines in, the mapped file by default.
+        :return: offset right after num_lines lines from offset start in buf.
+        """
+        buf = self._mmap if buf is None else buf
+        size = len(buf)
+        pos = start
+        while num_lines and pos < size:
+            chunk = np.frombuffer(buf, dtype=np.uint8, count=min(window, size - pos), offset=pos)
+            newlines = np.flatnonzero(chunk == ord('\n'))
+            if len(newlines) >= num_lines:
+                return pos + int(newlines[num_lines-1]) + 1
+            num_lines -= len(newlines)
+            pos += len(chunk)
+        return size
+
+    @staticmethod
+    def find_line_end(buf, prefix, window=4096):
+        """
+        :param buf: bytes-like.
+        :return: offset right after the first line of buf starting with prefix, len(buf) if there is none.
+        """
+        while True:
+            head = bytes(buf[:window])
+            p = head.find(prefix)
+            end = head.find(b'\n', p) if p != -1 else -1
+            if end != -1:
+                return end + 1
+            if window >= len(buf):
+                return len(buf)
+            window *= 4
+
+    def raw_stream(self):
+        """
+        :return: the binary stream under self.file positioned at its current offset, None if there is none.
+        """
+        if not self.file.seekable():
+            return None
+        if isinstance(self.file, io.TextIOWrapper):
+            stream = self.file.buffer
+            stream.seek(self.file.tell())
+            return stream
+        if isinstance(self.file, io.BufferedIOBase):
+            return self.file
+        return None
+
+    def sync_stream(self, stream):
+        """
+        Move self.file to where reading from its raw stream stopped.
+        """
+        self.last_pos = self.current_pos
+        self.current_pos = stream.tell()
+        if stream is not self.file:
+            self.file.seek(self.current_pos)
+
+    def decode_frame(self, buf, **kwargs):
+        """
+        Parse a frame from its raw bytes.
+        :param buf: bytes-like; a whole frame.
+        :param kwargs: passed to parse_frame().
+        """
+        self.frame = self.split_list(bytes(buf).decode().splitlines())
+        self.parse_frame(**kwargs)
+
+    def build_index(self, index_path=None):
+        """
+        Index the byte offset and timestep of every frame, reusing or extending the sidecar index file.
+        :param index_path: str; path of the sidecar index file, '<file>.idx' by default.
+        """
+        if self.frame_marker is None:
+            raise NotImplementedError("{ClassName} does not support frame index.".format(
+                ClassName=self.__class__.__name__))
+        path = getattr(self.file, 'name', None)
+        if not isinstance(path, str) or not os.path.isfile(path):
+            raise ValueError("{ClassName} Only files on disk can be indexed!".format(
+                ClassName=self.__class__.__name__))
+        pos = self.file.tell()
+        self.frame_index = FrameIndex(path, self.frame_marker, self.time_pattern,
+                                      index_path=index_path).update(stream=self.raw_stream())
+        self.file.seek(pos)
+        return self.frame_index
+
+    def seek_frame(self, n):
+        """
+        Jump to frame n (negative counts from the end), so that the next read_frame() reads it.
+        """
+        if self.frame_index is None:
+            self.build_index()
+        offset = self.frame_index.frame_range(n)[0]
+        self.file.seek(offset)
+        self.last_pos = self.current_pos = offset
+
+    def seek_time(self, time):
+        """
+        Jump to the first frame at the given timestep, so that the next read_frame() reads it.
+        """
+        if self.frame_index is None:
+            self.build_index()
+        self.seek_frame(self.frame_index.locate(time))
+
     def time_tell(self):
         if self.tell_time:
             if self.frame_time % self.tell_freq == 0:
@@ -56,3 +499,18 @@ class ParserBase(object):
         a_list = list(map(lambda x: x.strip('\n'), a_list))
         a_list = list(map(lambda x: x.split(), a_list))
         return a_list
+
+
+def _decode_ranges(parser_class, path, ranges, kwargs):
+    """
+    Worker of ParserBase.iter_frames_parallel: decode the frames at the given byte ranges of a file.
+    The file is opened for the task only; a compressed file is inflated from its start up to the first range.
+    """
+    parser = parser_class(None)
+    frame_jsons = list()
+    with open_binary(path) as stream:
+        for start, stop in ranges:
+            stream.seek(start)
+            parser.decode_frame(stream.read(stop - start), **kwargs)
+            frame_jsons.append(parser.frame_json)
+    return frame_jsons
@@ -0,0 +1,67 @@
+# Python 3.6.1
+
+import numpy as np
+
+
+class ColumnTable(object):
+    def __init__(self, dtypes, capacity=1024):
+        """
+        Table of preallocated numpy columns that grow as rows are added.
+        :param dtypes: dict; column name -> dtype, or (dtype, shape) for columns of arrays.
+        :param capacity: int; number of rows allocated at first.
+        """
+        self.dtypes = dict()
+        self.columns = dict()
+        self.size = 0
+        self.capacity = capacity
+        for name, dtype in dtypes.items():
+            self.add_column(name, dtype)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, name):
+        return self.columns[name][:self.size]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def keys(self):
+        return self.columns.keys()
+
+    def add_column(self, name, dtype=float):
+        """
+        Missing values are NaN in float columns, -1 in signed integer columns and 0 in the others.
+        """
+        dtype, shape = dtype if isinstance(dtype, tuple) else (dtype, ())
+        self.dtypes[name] = (np.dtype(dtype), shape)
+        self.columns[name] = self._allocate(name, self.capacity)
+
+    def add_rows(self, num_rows=1, **values):
+        """
+        :param values: initial values of the new rows, by column.
+        :return: slice of the new rows.
+        """
+        if self.size + num_rows > self.capacity:
+            self.capacity = max(2 * self.capacity, self.size + num_rows)
+            for name, column in self.columns.items():
+                self.columns[name] = self._allocate(name, self.capacity)
+                self.columns[name][:self.size] = column[:self.size]
+        rows = slice(self.size, self.size + num_rows)
+        self.size += num_rows
+        for name, value in values.items():
+            self.set(rows, name, value)
+        return rows
+
+    def set(self, rows, name, value):
+        """
+        Set column name of the given rows, adding it as a float column if it does not exist.
+        """
+        if name not in self.columns:
+            self.add_column(name)
+        self.columns[name][rows] = value
+
+    def _allocate(self, name, capacity):
+        dtype, shape = self.dtypes[name]
+        missing = {'f': np.nan, 'i': -1}.get(dtype.kind, 0)
+        return np.full((capacity,) + shape, missing, dtype=dtype)
@@ -1,12 +1,16 @@
 # Python 3.6.1
 
 import os
+import re
 import json
+import itertools
 import numpy as np
 
 from .base import ParserBase
 
 THIS_DIR = os.path.dirname(__file__)
+COMMENT_LINE = re.compile(rb'(?m)^#[^\n]*\n?')
+BLANK_LINE = re.compile(rb'\n[ \t\r]*(?=\n)')  # a blank line, matched with the line break before it
 
 
 class COLVARParser(ParserBase):
@@ -17,28 +21,129 @@ class COLVARParser(ParserBase):
             self.file_json = json.load(template)
 
         self.frame_time_list = list()
+        self.fields = list()  # all the columns of the file, from its '#! FIELDS' line
 
         self._time_col_i = time_col
 
-    def parse_file(self, start=0, stop=np.inf, t_mult=1):
-        array = list()
-        for i, line in enumerate(self.file):
-            if i == 0:
-                ll = line.split()
-                self.file_json['col_names'] = ll[2:]
-            else:
-                if line.startswith('#!'):
-                    continue
-                ll = list(map(float, line.strip().split()))
-                time = ll[self._time_col_i] * t_mult
-                if time < start:
-                    continue
-                if time > stop:
+    def parse_file(self, start=0, stop=np.inf, t_mult=1, columns=None, chunk_rows=1 << 16):
+        """
+        Load the rows with start <= time * t_mult <= stop into file_json['col_vectors'], one row per column.
+        :param columns: list of str; names of the columns to load, all by default.
+        See iter_chunks for the other parameters.
+        """
+        times = list()
+        blocks = list()
+        for chunk_times, block in self.iter_rows(start=start, stop=stop, t_mult=t_mult, columns=columns,
+                                                 chunk_rows=chunk_rows):
+            times.append(chunk_times)
+            blocks.append(block)
+        self.file_json['col_names'] = list(columns) if columns is not None else self.fields
+        self.file_json['col_vectors'] = np.concatenate(blocks, axis=1) if blocks else \
+            np.zeros((len(self.file_json['col_names']), 0))
+        self.frame_time_list.extend(np.concatenate(times).tolist() if times else list())
+
+    def iter_chunks(self, chunk_rows=1 << 16, columns=None, start=0, stop=np.inf, t_mult=1):
+        """
+        Read the file in blocks of chunk_rows rows, so that only one block is in memory at a time.
+        :param chunk_rows: int; number of data rows read at a time; comment and blank lines are not counted, so
+                           every block but the last has exactly chunk_rows rows before start and stop apply.
+        :param columns: list of str; names of the columns to keep, all by default.
+        :param start, stop: float; only keep the rows with start <= time * t_mult, and stop at the first row
+                            with time * t_mult > stop.
+        :param t_mult: float; multiplier of the time column.
+        :return: generator of numpy.array, shape=(len(columns), rows); the columns of the kept rows of a block.
+        """
+        for _, block in self.iter_rows(chunk_rows=chunk_rows, columns=columns, start=start, stop=stop,
+                                       t_mult=t_mult):
+            yield block
+
+    def iter_rows(self, chunk_rows=1 << 16, columns=None, start=0, stop=np.inf, t_mult=1):
+        """
+        See iter_chunks.
+        :return: generator of (times, block); the scaled times and the columns of the kept rows of a block.
+        """
+        stream = self.raw_stream()
+        i_columns = None
+        try:
+            while True:
+                lines = self.read_rows(stream, chunk_rows)
+                if not lines:
+                    break
+                if not self.fields:
+                    raise ValueError("{ClassName} No '#! FIELDS' line before the rows!".format(
+                        ClassName=self.__class__.__name__))
+                if i_columns is None:
+                    i_columns = self.column_indices(columns)
+
+                values = np.fromstring(lines, sep=' ')
+                if values.size % len(self.fields):
+                    raise ValueError("{ClassName} Rows do not match the FIELDS of the file!".format(
+                        ClassName=self.__class__.__name__))
+                rows = values.reshape((-1, len(self.fields)))
+
+                times = rows[:, self._time_col_i] * t_mult
+                keep = times >= start
+                past = np.flatnonzero(times > stop)
+                if len(past):
+                    keep[past[0]:] = False
+                if keep.any():
+                    self.frame_time = times[keep][-1]
+                    yield times[keep], np.ascontiguousarray(rows[keep][:, i_columns].T)
+                if len(past):
                     break
-                array.append(ll)
-                self.frame_time_list.append(time)
-        array = np.array(array).T
-        self.file_json['col_vectors'] = array
+        finally:
+            if stream is not None:
+                self.sync_stream(stream)
+
+    def read_rows(self, stream, num_rows):
+        """
+        Read the next num_rows data rows, from the binary stream if there is one. Comment lines are read with
+        parse_comments() and blank lines are skipped, neither counts as a row.
+        :return: bytes of the rows, fewer than num_rows only at the end of the file.
+        """
+        blocks = list()
+        num_read = 0
+        while num_read < num_rows:
+            if stream is not None:
+                lines = self.read_lines_bytes(stream, num_rows - num_read)
+            else:
+                lines = ''.join(itertools.islice(self.file, num_rows - num_read)).encode()
+            if not lines:
+                break
+            if b'#' in lines:
+                lines = self.parse_comments(lines)
+            if not lines.endswith(b'\n'):
+                lines += b'\n'
+            lines = BLANK_LINE.sub(b'', b'\n' + lines)[1:]
+            num_read += lines.count(b'\n')
+            blocks.append(lines)
+        return b''.join(blocks)
+
+    def parse_comments(self, lines):
+        """
+        Read the '#! FIELDS' lines among lines, which must not change within the file.
+        :return: lines without the comment lines.
+        """
+        for comment in COMMENT_LINE.findall(lines):
+            if comment.startswith(b'#! FIELDS'):
+                fields = comment.decode().split()[2:]
+                if self.fields and fields != self.fields:
+                    raise ValueError("{ClassName} FIELDS change within the file!".format(
+                        ClassName=self.__class__.__name__))
+                self.fields = fields
+        return COMMENT_LINE.sub(b'', lines)
+
+    def column_indices(self, columns):
+        """
+        :return: indices of the named columns among the fields of the file.
+        """
+        if columns is None:
+            return list(range(len(self.fields)))
+        missing = [_ for _ in columns if _ not in self.fields]
+        if missing:
+            raise ValueError("{ClassName} No column {Columns} in FIELDS!".format(
+                ClassName=self.__class__.__name__, Columns=', '.join(missing)))
+        return [self.fields.index(_) for _ in columns]
 
     def read_frame(self, **kwargs):
         raise NotImplementedError
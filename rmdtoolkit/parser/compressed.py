@@ -0,0 +1,143 @@
+# Python 3.6.1
+
+import io
+import bz2
+import zlib
+import lzma
+
+MAGIC_NUMBERS = ((b'\x1f\x8b', 'gz'), (b'BZh', 'bz2'), (b'\xfd7zXZ\x00', 'xz'))
+DECOMPRESSORS = {'gz': lambda: zlib.decompressobj(16 + zlib.MAX_WBITS),
+                 'bz2': bz2.BZ2Decompressor,
+                 'xz': lzma.LZMADecompressor}
+
+
+def compression_of(path):
+    """
+    :return: 'gz', 'bz2' or 'xz' by the magic number of the file, None if it is not compressed.
+    """
+    with open(path, 'rb') as file:
+        head = file.read(6)
+    for magic, compression in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def open_binary(path, **kwargs):
+    """
+    :return: seekable binary file object of the decompressed content of path.
+    :param kwargs: passed to DecompressedFile for compressed files.
+    """
+    compression = compression_of(path)
+    if compression is None:
+        return open(path, 'rb')
+    return io.BufferedReader(DecompressedFile(path, compression, **kwargs), buffer_size=1 << 20)
+
+
+def open_trajectory(path, **kwargs):
+    """
+    Open a trajectory file for the parsers, decompressing .gz/.bz2/.xz files on the fly.
+    :return: text file object.
+    """
+    return io.TextIOWrapper(open_binary(path, **kwargs))
+
+
+class DecompressedFile(io.RawIOBase):
+    def __init__(self, path, compression, spacing=1 << 24, history=1 << 22, chunk_size=1 << 16):
+        """
+        Seekable stream of the decompressed content of a gzip, bzip2 or xz file.
+        For gzip, the inflate state is checkpointed every spacing bytes of output while reading, so seeking
+        back only inflates from the nearest checkpoint rather than from the start of the file.
+        :param path: str; path of the compressed file.
+        :param compression: str; 'gz', 'bz2' or 'xz'.
+        :param spacing: int; bytes of output between checkpoints.
+        :param history: int; bytes of recent output kept to serve short backward seeks.
+        :param chunk_size: int; bytes of compressed input read at a time.
+        """
+        super().__init__()
+        self.name = path
+        self.compression = compression
+        self.spacing = spacing
+        self.history = history
+        self.chunk_size = chunk_size
+
+        self._file = open(path, 'rb')
+        self._new_decompressor = DECOMPRESSORS[compression]
+        self._decompressor = self._new_decompressor()
+        self._checkpoints = [(0, 0, self._decompressor.copy())] if compression == 'gz' else list()
+        self._out = bytearray()  # recent output, trimmed in place
+        self._out_start = 0  # offset of _out[0] in the output
+        self._pos = 0
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            while not self._eof:
+                self._pos = self._out_start + len(self._out)
+                self._fill()
+            offset += self._out_start + len(self._out)
+        if offset < self._out_start:
+            self._restart(offset)
+        self._pos = max(offset, 0)
+        return self._pos
+
+    def readinto(self, b):
+        while self._pos >= self._out_start + len(self._out) and not self._eof:
+            self._fill()
+        start = self._pos - self._out_start
+        size = max(min(len(b), len(self._out) - start), 0)
+        with memoryview(self._out) as out:  # released before _out is resized again
+            b[:size] = out[start:start + size]
+        self._pos += size
+        return size
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+    def _fill(self):
+        chunk = self._file.read(self.chunk_size)
+        if not chunk:
+            self._eof = True
+            return
+        if self._decompressor.eof:  # a new member/stream starts with this chunk
+            self._decompressor = self._new_decompressor()
+        data = self._decompressor.decompress(chunk)
+        while self._decompressor.eof and self._decompressor.unused_data:  # concatenated members/streams
+            rest = self._decompressor.unused_data
+            self._decompressor = self._new_decompressor()
+            data += self._decompressor.decompress(rest)
+
+        # Keep only the history before the read position
+        drop = max(min(self._pos, self._out_start + len(self._out)) - self.history - self._out_start, 0)
+        del self._out[:drop]
+        self._out += data
+        self._out_start += drop
+
+        end = self._out_start + len(self._out)
+        if self._checkpoints and end >= self._checkpoints[-1][0] + self.spacing:
+            self._checkpoints.append((end, self._file.tell(), self._decompressor.copy()))
+
+    def _restart(self, offset):
+        # Resume inflating from the last checkpoint before offset, or from the start of the file
+        checkpoint = (0, 0, None)
+        for checkpoint in reversed(self._checkpoints):
+            if checkpoint[0] <= offset:
+                break
+        out_start, file_pos, decompressor = checkpoint
+        self._file.seek(file_pos)
+        self._decompressor = decompressor.copy() if decompressor is not None else self._new_decompressor()
+        self._out = bytearray()
+        self._out_start = out_start
+        self._eof = False
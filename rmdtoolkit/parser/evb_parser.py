@@ -1,31 +1,31 @@
 # Python 3.6.1
 
-import os
-import copy
-import json
 import numpy as np
 
 from .base import ParserBase
+from .column_table import ColumnTable
+from .frames import EVBFrame, EVBComplex
 
-THIS_DIR = os.path.dirname(__file__)
+EVB_SECTIONS = ('rc_location', 'energy_summary', 'states', 'eigen_vector', 'cec_coordinate')
+STATE_KEYS = ('id', 'parent', 'shell', 'mol_A', 'mol_B', 'react', 'path', 'extra_cpl')
 
 
 class EVBParser(ParserBase):
+    frame_marker = b'*****'
+    time_pattern = rb'(?s)\*{5}.*?\nTIMESTEP\s+(-?\d+)\s'
+
     def __init__(self, file, **kwargs):
         super().__init__(file, **kwargs)
 
-        with open('{}/templates/evb/evb_frame.json'.format(THIS_DIR), 'r') as fframe, \
-                open('{}/templates/evb/evb_complex.json'.format(THIS_DIR), 'r') as fcomplex, \
-                open('{}/templates/evb/evb_complex_state.json'.format(THIS_DIR), 'r') as fstate:
-            self.frame_template = json.load(fframe)
-            self.complex_template = json.load(fcomplex)
-            self.state_template = json.load(fstate)
-
         self.frame_time = int()
-        self.frame_json = copy.deepcopy(self.frame_template)
+        self.frame_json = EVBFrame()
         self.frame_time_list = list()
         self.frame_json_list = list()
 
+        self.frame_table = None
+        self.complex_table = None
+        self.state_table = None
+
     def read_frame(self):
         frame = list()
         status = 0
@@ -45,7 +45,7 @@ class EVBParser(ParserBase):
         return status
 
     def parse_frame(self, complex_type=False):
-        self.frame_json = copy.deepcopy(self.frame_template)
+        self.frame_json = EVBFrame()
         icomp = -1
 
         for i, linel in enumerate(self.frame):
@@ -57,7 +57,7 @@ class EVBParser(ParserBase):
             if linel[0] == 'COMPLEX_COUNT':
                 self.frame_json["complex_count"] = int(linel[1])
                 for j in range(int(linel[1])):
-                    self.frame_json["complex"].append(copy.deepcopy(self.complex_template))
+                    self.frame_json["complex"].append(EVBComplex())
             if linel[0] == 'REACTION_CENTER_LOCATION':
                 for j in range(i + 1, i + 1 + self.frame_json["complex_count"]):
                     self.frame_json["rc_location"].append(int(self.frame[j][1]))
@@ -79,7 +79,7 @@ class EVBParser(ParserBase):
             if linel[0] == 'COMPLEX' and linel[1] == str(icomp+1) + ':':
                 self.frame_json["complex"][icomp]["states_count"] = int(linel[2])
                 for j in range(int(linel[2])):
-                    self.frame_json["complex"][icomp]["states"].append(copy.deepcopy(self.state_template))
+                    self.frame_json["complex"][icomp]["states"].append(dict.fromkeys(STATE_KEYS, 0))
             if linel[0] == 'STATES':
                 keys = ''.join(linel[1:]).replace('[', '').replace(']', '').split('|')
                 for istate, j in enumerate(range(i + 1, i + 1 + self.frame_json["complex"][icomp]["states_count"])):
@@ -107,14 +107,132 @@ class EVBParser(ParserBase):
                 comp_type = '-'.join(num_shells)
                 self.frame_json["extra"]["complex_type"].append(comp_type)
 
-    def parse_file(self, debug=None, **kwargs):
-        while True:
-            status = self.read_frame()
-            if status == 1:
-                break
-            self.parse_frame(**kwargs)
+    def parse_file(self, debug=None, workers=None, **kwargs):
+        """
+        :param debug: int; only parse the first debug frames.
+        :param workers: int; parse in this many processes, see iter_frames_parallel.
+        """
+        if workers:
+            frame_jsons = self.iter_frames_parallel(stop=debug or None, workers=workers, **kwargs)
+        else:
+            frame_jsons = self.iter_frames(stop=debug or None, **kwargs)
+        for frame_json in frame_jsons:
             self.frame_time_list.append(self.frame_time)
-            self.frame_json_list.append(copy.deepcopy(self.frame_json))
-            self.time_tell()
-            if debug and len(self.frame_time_list) >= debug:
-                break
+            self.frame_json_list.append(frame_json)
+
+    def parse_columns(self, sections=EVB_SECTIONS, start=0, stop=None, stride=1):
+        """
+        Parse the file into column tables instead of per-frame dicts. Columns are numpy arrays over all frames:
+        frame_table, one row per frame: time, complex_count, ene_environment, ene_inter_cplx, ene_total and
+            the ENVIRONMENT terms;
+        complex_table, one row per complex: frame, complex, rc_location, ene_complex, states_count, cec_coordinate;
+        state_table, one row per state: frame, complex, the STATES columns and its eigen_vector component.
+        The frame and complex columns are row numbers in frame_table and complex numbers within the frame.
+        :param sections: iterable of the sections to parse, among EVB_SECTIONS; the others are skipped.
+        Values of the skipped sections are missing: NaN in float columns and -1 in integer columns.
+        See ParserBase.iter_frames for the other parameters. Files on disk are memory-mapped, compressed files
+        are read through their decompressed stream.
+        """
+        sections = set(sections)
+        if not sections.issubset(EVB_SECTIONS):
+            raise ValueError("{ClassName} Unrecognized sections {Sections}!".format(
+                ClassName=self.__class__.__name__, Sections=sorted(sections.difference(EVB_SECTIONS))))
+
+        self.frame_table = ColumnTable({"time": np.int64, "complex_count": np.int64})
+        self.complex_table = ColumnTable({"frame": np.int64, "complex": np.int64, "states_count": np.int64,
+                                          "rc_location": np.int64, "cec_coordinate": (float, (3,))})
+        self.state_table = ColumnTable(dict({"frame": np.int64, "complex": np.int64},
+                                            **dict.fromkeys(STATE_KEYS, np.int64)))
+        stream = None
+        try:
+            self.map_file()
+        except ValueError:  # compressed file, read frames from the decompressed stream
+            stream = self.raw_stream()
+            if stream is None:
+                raise
+        if stream is None:
+            buffers = self.iter_frame_buffers(start=start, stop=stop, stride=stride)
+        else:
+            buffers = self.iter_stream_buffers(stream, start=start, stop=stop, stride=stride)
+        try:
+            for buf in buffers:
+                self.parse_frame_columns(bytes(buf).decode().splitlines(), sections)
+                self.time_tell()
+        finally:
+            buffers.close()
+            if stream is not None:
+                self.sync_stream(stream)
+
+    def parse_frame_columns(self, lines, sections):
+        """
+        Append one frame to the column tables.
+        :param lines: list of str; lines of the frame.
+        :param sections: set of the sections to parse.
+        """
+        i_frame = self.frame_table.add_rows(1).start
+        self.frame_time = 0
+        complexes = slice(0, 0)  # rows of this frame in complex_table
+        states = slice(0, 0)  # rows of the current complex in state_table
+        icomp = -1
+        iene = 0
+
+        i = 0
+        while i < len(lines):
+            linel = lines[i].split()
+            i += 1
+            if not linel:
+                continue
+            key = linel[0]
+
+            if key == 'TIMESTEP':
+                self.frame_time = int(linel[1])
+                self.frame_table.set(i_frame, "time", self.frame_time)
+            elif key == 'COMPLEX_COUNT':
+                count = int(linel[1])
+                self.frame_table.set(i_frame, "complex_count", count)
+                complexes = self.complex_table.add_rows(count, frame=i_frame, complex=np.arange(count))
+            elif key == 'REACTION_CENTER_LOCATION':
+                if 'rc_location' in sections:
+                    for j in range(complexes.stop - complexes.start):
+                        self.complex_table.set(complexes.start + j, "rc_location", int(lines[i + j].split()[1]))
+                i += complexes.stop - complexes.start
+            elif key.startswith('ENE_'):
+                if 'energy_summary' not in sections:
+                    continue
+                if key.startswith('ENE_COMPLEX'):
+                    self.complex_table.set(complexes.start + iene, "ene_complex", float(linel[1]))
+                    iene += 1
+                else:
+                    self.frame_table.set(i_frame, key.lower(), float(linel[1]))
+            elif key == 'ENVIRONMENT':
+                if 'energy_summary' in sections:
+                    keys = ''.join(linel[1:]).replace('[', '').replace(']', '').split('|')
+                    for env_key, value in zip(keys, lines[i].split()):
+                        self.frame_table.set(i_frame, env_key, float(value))
+                i += 1
+            elif key == 'START_OF_COMPLEX':
+                icomp += 1
+            elif key == 'COMPLEX' and linel[1] == str(icomp + 1) + ':':
+                states_count = int(linel[2])
+                self.complex_table.set(complexes.start + icomp, "states_count", states_count)
+                if 'states' in sections or 'eigen_vector' in sections:
+                    states = self.state_table.add_rows(states_count, frame=i_frame, complex=icomp)
+                else:
+                    states = slice(0, states_count)
+            elif key == 'STATES':
+                num_states = states.stop - states.start
+                if 'states' in sections and num_states:
+                    keys = ''.join(linel[1:]).replace('[', '').replace(']', '').split('|')
+                    values = np.array([lines[j].split() for j in range(i, i + num_states)], dtype=np.int64)
+                    for k, state_key in enumerate(keys):
+                        self.state_table.set(states, state_key, values[:, k])
+                i += num_states
+            elif key == 'EIGEN_VECTOR':
+                if 'eigen_vector' in sections:
+                    self.state_table.set(states, "eigen_vector", np.array(lines[i].split(), dtype=float))
+                i += 1
+            elif key == 'CEC_COORDINATE':
+                if 'cec_coordinate' in sections:
+                    self.complex_table.set(complexes.start + icomp, "cec_coordinate",
+                                           np.array(lines[i].split(), dtype=float))
+                i += 1
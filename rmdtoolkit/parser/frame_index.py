@@ -0,0 +1,168 @@
+# Python 3.6.1
+
+import os
+import re
+import warnings
+import numpy as np
+
+
+class FrameIndex(object):
+    def __init__(self, path, marker, time_pattern, index_path=None, chunk_size=1 << 24):
+        """
+        Byte offsets and timesteps of every frame in a trajectory file, kept in a sidecar index file.
+        :param path: str; path of the trajectory file.
+        :param marker: bytes; the line every frame starts with, e.g. b'ITEM: TIMESTEP'.
+        :param time_pattern: bytes; regex matched at the start of a frame, its 1st group being the timestep.
+        :param index_path: str; path of the sidecar index file, '<path>.idx' by default.
+        :param chunk_size: int; number of bytes read at a time during the indexing pass.
+        """
+        self.path = path
+        self.marker = marker
+        self.time_regex = re.compile(time_pattern)
+        self.index_path = index_path or '{}.idx'.format(path)
+        self.chunk_size = chunk_size
+
+        self.offsets = np.array([], dtype=np.int64)
+        self.times = np.array([], dtype=np.int64)
+        self.file_size = 0  # size of the file when indexed
+        self.file_mtime = 0
+        self.end = 0  # end offset of the last frame, differs from file_size for compressed files
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def frame_range(self, n):
+        """
+        :return: start and stop byte offsets of frame n.
+        """
+        n = range(len(self.offsets))[n]
+        stop = self.offsets[n + 1] if n + 1 < len(self.offsets) else self.end
+        return int(self.offsets[n]), int(stop)
+
+    def locate(self, time):
+        """
+        :return: number of the first frame at the given timestep.
+        """
+        found = np.flatnonzero(self.times == time)
+        if not found.size:
+            raise ValueError("{ClassName} No frame at time {Time}!".format(ClassName=self.__class__.__name__,
+                                                                         Time=time))
+        return int(found[0])
+
+    def update(self, stream=None):
+        """
+        Load the sidecar index if it matches the file, extend it if the file has grown, otherwise rebuild it.
+        :param stream: seekable binary file object of the (decompressed) content, the file itself by default.
+        """
+        stat = os.stat(self.path)
+        if not len(self.offsets):
+            self.load()
+        if stat.st_size == self.file_size and stat.st_mtime_ns == self.file_mtime:
+            return self
+
+        own_stream = stream is None
+        if own_stream:
+            stream = open(self.path, 'rb')
+        try:
+            if stat.st_size > self.file_size and len(self.offsets) and self._check_last(stream):
+                # The last indexed frame may have been incomplete, so rescan from its start
+                start = int(self.offsets[-1])
+                offsets, times = self.offsets[:-1], self.times[:-1]
+            else:
+                start = 0
+                offsets, times = self.offsets[:0], self.times[:0]
+            new_offsets, new_times = self.scan(stream, start)
+            self.end = stream.tell()
+        finally:
+            if own_stream:
+                stream.close()
+
+        self.offsets = np.append(offsets, new_offsets).astype(np.int64)
+        self.times = np.append(times, new_times).astype(np.int64)
+        self.file_size = stat.st_size
+        self.file_mtime = stat.st_mtime_ns
+        self.save()
+        return self
+
+    def scan(self, stream, start=0):
+        """
+        :param stream: binary file object of the trajectory.
+        :param start: int; offset to scan from, must be the start of a frame or 0.
+        :return: offsets and timesteps of the frames found after start.
+        """
+        offsets = list()
+        times = list()
+        needle = b'\n' + self.marker
+
+        stream.seek(start)
+        base = start  # offset of buf[0] in the file
+        tail = b''
+        first = True
+        while True:
+            chunk = stream.read(self.chunk_size)
+            eof = not chunk
+            buf = tail + chunk
+            if first and not eof and len(buf) < len(self.marker):
+                tail = buf
+                continue
+            cut = max(len(buf) - len(needle) + 1, 0)  # a needle starting after cut may be cut off by the chunk
+
+            candidates = list()
+            if first and buf.startswith(self.marker):
+                candidates.append(0)
+            first = False
+            p = buf.find(needle)
+            while p != -1:
+                candidates.append(p + 1)
+                p = buf.find(needle, p + 1)
+
+            for c in candidates:
+                m = self.time_regex.match(buf, c)
+                if m is None:
+                    if not eof and len(buf) - c < 4096:  # header cut off by the chunk, retry with more data
+                        cut = max(c - 1, 0)
+                        first = c == 0
+                        break
+                    continue  # malformed or truncated frame header
+                offsets.append(base + c)
+                times.append(int(m.group(1)))
+
+            if eof:
+                break
+            tail = buf[cut:]
+            base += cut
+        return offsets, times
+
+    def load(self):
+        if not os.path.isfile(self.index_path):
+            return False
+        try:
+            with open(self.index_path, 'rb') as index_file:
+                data = np.load(index_file)
+                if bytes(data['marker']) != self.marker:
+                    return False
+                offsets, times = data['offsets'], data['times']
+                file_size, file_mtime, end = (int(_) for _ in data['stat'])
+        except (OSError, ValueError, KeyError):
+            warnings.warn('{ClassName} Failed to read index file {Path}, rebuilding.'
+                          .format(ClassName=self.__class__.__name__, Path=self.index_path))
+            return False
+        self.offsets, self.times = offsets, times
+        self.file_size, self.file_mtime, self.end = file_size, file_mtime, end
+        return True
+
+    def save(self):
+        try:
+            with open(self.index_path, 'wb') as index_file:
+                np.savez(index_file, offsets=self.offsets, times=self.times,
+                         stat=np.array([self.file_size, self.file_mtime, self.end], dtype=np.int64),
+                         marker=np.frombuffer(self.marker, dtype=np.uint8))
+        except OSError:
+            warnings.warn('{ClassName} Cannot write index file {Path}, index is kept in memory only.'
+                          .format(ClassName=self.__class__.__name__, Path=self.index_path))
+
+    def _check_last(self, stream):
+        # Make sure the file was appended to rather than rewritten
+        stream.seek(int(self.offsets[-1]))
+        m = self.time_regex.match(stream.read(4096))
+        return m is not None and int(m.group(1)) == self.times[-1]
@@ -0,0 +1,124 @@
+# Python 3.6.1
+
+import collections.abc
+import numpy as np
+
+
+class FrameBase(collections.abc.Mapping):
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError("{ClassName} has no field {Key}!".format(ClassName=self.__class__.__name__, Key=key))
+        setattr(self, key, value)
+
+    def __iter__(self):
+        return iter(self.__slots__)
+
+    def __len__(self):
+        return len(self.__slots__)
+
+    def __repr__(self):
+        return '{ClassName}({Fields})'.format(ClassName=self.__class__.__name__,
+                                              Fields=', '.join('{}={!r}'.format(*_) for _ in self.items()))
+
+    def to_dict(self):
+        """
+        :return: dict of the fields, in the format of the former frame_json dicts.
+        """
+        fields = dict()
+        for key, value in self.items():
+            if isinstance(value, list):
+                value = [_.to_dict() if isinstance(_, FrameBase) else _ for _ in value]
+            fields[key] = value
+        return fields
+
+
+class DumpFrame(FrameBase):
+    __slots__ = ('time', 'num_atoms', 'bounds', 'box_lengths', 'atom_keys', 'atom_info')
+
+    def __init__(self, time=0, num_atoms=0, bounds=None, box_lengths=None, atom_keys=None, atom_info=None):
+        """
+        A frame of a LAMMPS dump file. Fields are also accessible as keys, e.g. frame["atom_info"].
+        """
+        self.time = time
+        self.num_atoms = num_atoms
+        self.bounds = np.zeros((3, 2)) if bounds is None else bounds
+        self.box_lengths = np.zeros(3) if box_lengths is None else box_lengths
+        self.atom_keys = list() if atom_keys is None else atom_keys
+        self.atom_info = np.zeros((0, 0)) if atom_info is None else atom_info
+
+
+class XYZFrame(FrameBase):
+    __slots__ = ('num_atoms', 'comment', 'atoms', 'coords')
+
+    def __init__(self, num_atoms=0, comment='', atoms=None, coords=None):
+        """
+        A frame of an XYZ file. Fields are also accessible as keys, e.g. frame["coords"].
+        """
+        self.num_atoms = num_atoms
+        self.comment = comment
+        self.atoms = np.zeros(0, dtype=str) if atoms is None else atoms
+        self.coords = np.zeros((0, 3)) if coords is None else coords
+
+
+class EVBFrame(FrameBase):
+    __slots__ = ('time', 'complex_count', 'rc_location', 'energy_summary', 'complex', 'extra')
+
+    def __init__(self, time=0, complex_count=0):
+        """
+        A frame of a RAPTOR EVB output file. Fields are also accessible as keys, e.g. frame["complex"][0].
+        energy_summary and extra are dicts, complex is a list of EVBComplex.
+        """
+        self.time = time
+        self.complex_count = complex_count
+        self.rc_location = list()
+        self.energy_summary = {"ene_environment": dict.fromkeys(('total', 'vdw', 'coul', 'bond', 'angle',
+                                                                 'dihedral', 'improper', 'kspace'), 0.0),
+                               "ene_complex": list(),
+                               "ene_inter_cplx": 0.0,
+                               "ene_total": 0.0}
+        self.complex = list()
+        self.extra = dict()
+
+
+class EVBComplex(FrameBase):
+    __slots__ = ('states_count', 'states', 'eigen_vector', 'cec_coordinate')
+
+    def __init__(self, states_count=0):
+        """
+        A complex of an EVBFrame; states is a list of dicts of the STATES columns.
+        """
+        self.states_count = states_count
+        self.states = list()
+        self.eigen_vector = list()
+        self.cec_coordinate = list()
+
+
+class PDBFrame(FrameBase):
+    __slots__ = ('model', 'records', 'serials', 'atoms', 'alt_locs', 'res_names', 'chain_ids', 'res_seqs',
+                 'i_codes', 'coords', 'occupancies', 'b_factors', 'elements')
+
+    def __init__(self, model=0):
+        """
+        A frame (MODEL) of a PDB file, one entry per ATOM/HETATM record. Fields are also accessible as keys.
+        String fields are numpy arrays of str, stripped; res_seqs are kept as str as they may carry letters.
+        """
+        self.model = model
+        self.records = np.zeros(0, dtype=str)
+        self.serials = np.zeros(0, dtype=np.int64)
+        self.atoms = np.zeros(0, dtype=str)
+        self.alt_locs = np.zeros(0, dtype=str)
+        self.res_names = np.zeros(0, dtype=str)
+        self.chain_ids = np.zeros(0, dtype=str)
+        self.res_seqs = np.zeros(0, dtype=str)
+        self.i_codes = np.zeros(0, dtype=str)
+        self.coords = np.zeros((0, 3))
+        self.occupancies = np.zeros(0)
+        self.b_factors = np.zeros(0)
+        self.elements = np.zeros(0, dtype=str)
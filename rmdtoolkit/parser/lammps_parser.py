@@ -1,26 +1,42 @@
 # Python 3.6.1
 
-import os
-import copy
-import json
+import re
 import numpy as np
 
 from .base import ParserBase
+from .frames import DumpFrame
 
-THIS_DIR = os.path.dirname(__file__)
+ATOM_STYLES = {'atomic': ('id', 'type', 'x', 'y', 'z'),
+               'charge': ('id', 'type', 'q', 'x', 'y', 'z'),
+               'bond': ('id', 'mol', 'type', 'x', 'y', 'z'),
+               'angle': ('id', 'mol', 'type', 'x', 'y', 'z'),
+               'molecular': ('id', 'mol', 'type', 'x', 'y', 'z'),
+               'full': ('id', 'mol', 'type', 'q', 'x', 'y', 'z'),
+               'sphere': ('id', 'type', 'diameter', 'density', 'x', 'y', 'z')}
+INT_KEYS = ('id', 'mol', 'type', 'ix', 'iy', 'iz')
+# Section of a data file -> header count giving its number of lines
+SECTION_COUNTS = {'Atoms': 'atoms', 'Velocities': 'atoms', 'Masses': 'atom types',
+                  'Bonds': 'bonds', 'Angles': 'angles', 'Dihedrals': 'dihedrals', 'Impropers': 'impropers',
+                  'Pair Coeffs': 'atom types', 'Bond Coeffs': 'bond types', 'Angle Coeffs': 'angle types',
+                  'Dihedral Coeffs': 'dihedral types', 'Improper Coeffs': 'improper types',
+                  'Ellipsoids': 'ellipsoids', 'Lines': 'lines', 'Triangles': 'triangles'}
+TOPOLOGY_SECTIONS = ('Bonds', 'Angles', 'Dihedrals', 'Impropers')
+BLANK_LINES = re.compile(rb'(?:[ \t\r]*\n)*')
+SECTION_END = re.compile(rb'\n[ \t\r]*(?:\n|$)')
 
 
 class DumpParser(ParserBase):
+    frame_marker = b'ITEM: TIMESTEP'
+    time_pattern = rb'ITEM: TIMESTEP\s+(-?\d+)\s'
+
     def __init__(self, file, **kwargs):
         super().__init__(file, **kwargs)
 
-        with open('{}/templates/lammps/dump_frame.json'.format(THIS_DIR), 'r') as fframe:
-            self.frame_template = json.load(fframe)
-
         self.frame_time = int()
-        self.frame_json = copy.deepcopy(self.frame_template)
+        self.frame_json = DumpFrame()
         self.frame_time_list = list()
         self.frame_json_list = list()
+        self._id_order = None  # permutation that sorted the atoms of the last frame by id
 
     def read_frame(self):
         frame = list()
@@ -40,8 +56,39 @@ class DumpParser(ParserBase):
         self.frame = self.split_list(frame)
         return status
 
-    def parse_frame(self, box_lengths=True):
-        self.frame_json = copy.deepcopy(self.frame_template)
+    def parse_frame(self, box_lengths=True, columns=None, types=None, ids=None, sort_ids=False):
+        """
+        :param columns: list of str; atom keys to keep, in this order. All columns by default.
+        :param types: list of int; only keep atoms of these types.
+        :param ids: list of int; only keep atoms with these ids.
+        With columns, types or ids given, atom_keys, atom_info and num_atoms only cover what is kept.
+        :param sort_ids: bool; order the atoms by id, see sort_atoms.
+        """
+        i_atoms = self.parse_header(box_lengths=box_lengths)
+        if i_atoms is not None:
+            atoms = self.frame[i_atoms+1:]
+            id_column = sort_ids and columns is not None and 'id' not in columns  # only needed for sorting
+            if id_column:
+                columns = list(columns) + ['id']
+            if columns is None and types is None and ids is None:
+                self.frame_json["atom_info"] = np.array(atoms).astype(float)
+            else:
+                i_columns, rows = self.select_atoms(columns, types, ids,
+                                                    lambda i: np.array([_[i] for _ in atoms]).astype(float))
+                atoms = atoms if rows is None else [atoms[_] for _ in rows]
+                atom_info = np.array([[_[i] for i in i_columns] for _ in atoms]).astype(float)
+                self.frame_json["atom_info"] = atom_info.reshape((len(atoms), len(i_columns)))
+                self.frame_json["num_atoms"] = len(atoms)
+            if sort_ids:
+                self.sort_atoms(drop_id=id_column)
+
+    def parse_header(self, box_lengths=True):
+        """
+        Parse self.frame up to the 'ITEM: ATOMS' line into a new DumpFrame, self.frame_json.
+        :return: index of the 'ITEM: ATOMS' line, None if there is none.
+        """
+        self.frame_json = DumpFrame()
+        i_atoms = None
 
         for i, linel in enumerate(self.frame):
             if not linel:
@@ -64,25 +111,369 @@ class DumpParser(ParserBase):
                 if linel[1] == 'ATOMS':
                     atom_keys = linel[2:]
                     self.frame_json["atom_keys"] = atom_keys
-                    self.frame_json["atom_info"] = np.array(self.frame[i+1:]).astype(float)
+                    i_atoms = i
                     break
 
         self.frame_time = self.frame_json["time"]
+        return i_atoms
 
-    def parse_file(self, debug=None, **kwargs):
+    def read_frame_bytes(self, stream):
+        """
+        Read the next frame from a binary stream, pulling its whole ATOMS block in one read.
+        :param stream: binary file object positioned at the start of a frame.
+        :return: bytes of the frame, empty at the end of the file.
+        """
+        head = list()
+        num_atoms = 0
         while True:
-            status = self.read_frame()
-            if status == 1:
+            line = stream.readline()
+            if not line:
                 break
-            self.parse_frame(**kwargs)
-            self.frame_time_list.append(self.frame_time)
-            self.frame_json_list.append(copy.deepcopy(self.frame_json))
-            self.time_tell()
-            if debug and len(self.frame_time_list) >= debug:
+            head.append(line)
+            if line.startswith(b'ITEM: NUMBER OF ATOMS'):
+                line = stream.readline()
+                head.append(line)
+                num_atoms = int(line)
+            elif line.startswith(b'ITEM: ATOMS'):
                 break
+        head.append(self.read_lines_bytes(stream, num_atoms))
+        return b''.join(head)
+
+    def decode_frame(self, buf, box_lengths=True, columns=None, types=None, ids=None, sort_ids=False):
+        """
+        Parse a frame from its raw bytes, decoding the ATOMS block in bulk.
+        :param buf: bytes-like; a whole frame starting from its 'ITEM: TIMESTEP' line.
+        See parse_frame for the other parameters; only the selected fields of the block are decoded.
+        """
+        head_end = self.find_line_end(buf, b'ITEM: ATOMS')
+        self.frame = self.split_list(bytes(buf[:head_end]).decode().splitlines())
+        buf = memoryview(buf)  # slice the ATOMS block without copying it
+        if self.parse_header(box_lengths=box_lengths) is not None:
+            id_column = sort_ids and columns is not None and 'id' not in columns  # only needed for sorting
+            if id_column:
+                columns = list(columns) + ['id']
+            if columns is None and types is None and ids is None:
+                self.frame_json["atom_info"] = self.decode_atoms(buf[head_end:])
+            else:
+                self.frame_json["atom_info"] = self.decode_selected_atoms(buf[head_end:], columns, types, ids)
+                self.frame_json["num_atoms"] = len(self.frame_json["atom_info"])
+            if sort_ids:
+                self.sort_atoms(drop_id=id_column)
+
+    def sort_atoms(self, drop_id=False):
+        """
+        Order atom_info by atom id. The order of the last frame is kept and reused while it still sorts
+        the ids, which only costs a check when LAMMPS writes the atoms in the same order again.
+        :param drop_id: bool; remove the id column, the last one, after sorting.
+        """
+        atom_keys = self.frame_json["atom_keys"]
+        if 'id' not in atom_keys:
+            raise ValueError("{ClassName} No 'id' in ATOMS of frame {Time}!".format(
+                ClassName=self.__class__.__name__, Time=self.frame_time))
+        atom_info = self.frame_json["atom_info"]
+        atom_ids = atom_info[:, atom_keys.index('id')]
+        order = self._id_order
+        if order is None or len(order) != len(atom_ids) or (np.diff(atom_ids[order]) < 0).any():
+            order = self._id_order = np.argsort(atom_ids, kind='stable')
+        atom_info = atom_info[order]
+        if drop_id:
+            atom_info = atom_info[:, :-1]
+            self.frame_json["atom_keys"] = atom_keys[:-1]
+        self.frame_json["atom_info"] = atom_info
+
+    def decode_atoms(self, block):
+        """
+        :param block: bytes-like; lines of the ATOMS block.
+        :return: numpy.array, shape=(num_atoms, len(atom_keys))
+        """
+        shape = (self.frame_json["num_atoms"], len(self.frame_json["atom_keys"]))
+        if not shape[0]:
+            return np.zeros(shape)
+        atom_info = np.fromstring(bytes(block), sep=' ')  # numpy only scans text from bytes
+        if atom_info.size != shape[0] * shape[1]:
+            raise ValueError("{ClassName} ATOMS of frame {Time} do not match NUMBER OF ATOMS!".format(
+                ClassName=self.__class__.__name__, Time=self.frame_time))
+        return atom_info.reshape(shape)
+
+    def decode_selected_atoms(self, block, columns=None, types=None, ids=None, chunk_bytes=1 << 18):
+        """
+        Decode the ATOMS block in chunks of whole lines and keep only the selected atoms and columns of each,
+        so that the atoms and columns dropped are never held beyond a chunk.
+        :param block: bytes-like; lines of the ATOMS block.
+        :param chunk_bytes: int; bytes of text decoded at a time.
+        :return: numpy.array, shape=(num_kept_atoms, len(columns))
+        """
+        atom_keys = self.frame_json["atom_keys"]
+        num_columns = len(atom_keys)
+        i_columns, _ = self.select_atoms(columns, types, ids)
+        if i_columns == list(range(num_columns)):
+            i_columns = slice(None)
+        atom_info = None  # without atoms to drop, the kept columns go straight into the result
+        if types is None and ids is None:
+            atom_info = np.empty((self.frame_json["num_atoms"], len(self.frame_json["atom_keys"])))
+        tables = list()
+        num_atoms = 0
+        pos = 0
+        while pos < len(block):
+            text = bytes(block[pos:pos+chunk_bytes])
+            end = len(text) if pos + len(text) >= len(block) else text.rfind(b'\n') + 1
+            if not end:  # a line longer than the chunk
+                chunk_bytes *= 2
+                continue
+            table = np.fromstring(text[:end], sep=' ')  # numpy only scans text from bytes
+            pos += end
+            if table.size % num_columns:
+                break
+            table = table.reshape((-1, num_columns))
+            if atom_info is not None:
+                if num_atoms + len(table) > len(atom_info):
+                    break
+                atom_info[num_atoms:num_atoms+len(table)] = table[:, i_columns]
+            else:
+                tables.append(table[self.atom_mask(atom_keys, types, ids, lambda i: table[:, i])][:, i_columns])
+            num_atoms += len(table)
+        if pos < len(block) or num_atoms != self.frame_json["num_atoms"]:
+            raise ValueError("{ClassName} ATOMS of frame {Time} do not match NUMBER OF ATOMS!".format(
+                ClassName=self.__class__.__name__, Time=self.frame_time))
+        if atom_info is not None:
+            return atom_info
+        return np.concatenate(tables) if tables else np.zeros((0, len(self.frame_json["atom_keys"])))
+
+    def select_atoms(self, columns=None, types=None, ids=None, get_column=None):
+        """
+        :param get_column: function; column index -> numpy.array of that column of all atoms.
+        :return: indices of the selected columns in atom_keys,
+                 indices of the atoms of the given types and ids, None to keep all atoms or without get_column.
+        """
+        atom_keys = self.frame_json["atom_keys"]
+        for key in (columns or list()) + ['type'] * (types is not None) + ['id'] * (ids is not None):
+            if key not in atom_keys:
+                raise ValueError("{ClassName} No '{Key}' in ATOMS of frame {Time}!".format(
+                    ClassName=self.__class__.__name__, Key=key, Time=self.frame_time))
+        i_columns = [atom_keys.index(_) for _ in columns] if columns is not None else list(range(len(atom_keys)))
+        self.frame_json["atom_keys"] = [atom_keys[_] for _ in i_columns]
+
+        keep = self.atom_mask(atom_keys, types, ids, get_column) if get_column is not None else None
+        rows = np.flatnonzero(keep) if keep is not None else None
+        return i_columns, rows
+
+    @staticmethod
+    def atom_mask(atom_keys, types=None, ids=None, get_column=None):
+        """
+        :param get_column: function; column index -> numpy.array of that column of the atoms.
+        :return: numpy.array of bool; the atoms of the given types and ids, None to keep all atoms.
+        """
+        keep = None
+        for key, values in (('type', types), ('id', ids)):
+            if values is not None:
+                found = np.isin(get_column(atom_keys.index(key)), values)
+                keep = found if keep is None else keep & found
+        return keep
+
+    def iter_frames(self, start=0, stop=None, stride=1, bulk=True, **kwargs):
+        """
+        :param bulk: bool; read frames as raw bytes and decode the ATOMS blocks in bulk when the file allows.
+                     Frames read with use_mmap or prefetch are always decoded in bulk.
+        See ParserBase.iter_frames for the other parameters.
+        """
+        yield from super().iter_frames(start=start, stop=stop, stride=stride, raw=bulk, **kwargs)
+
+    def parse_file(self, debug=None, workers=None, **kwargs):
+        """
+        :param debug: int; only parse the first debug frames.
+        :param workers: int; parse in this many processes, see iter_frames_parallel.
+        """
+        if workers:
+            frame_jsons = self.iter_frames_parallel(stop=debug or None, workers=workers, **kwargs)
+        else:
+            frame_jsons = self.iter_frames(stop=debug or None, **kwargs)
+        for frame_json in frame_jsons:
+            self.frame_time_list.append(self.frame_time)
+            self.frame_json_list.append(frame_json)
 
 
-# TODO
 class DataParser(ParserBase):
-    def __init__(self, file, **kwargs):
+    def __init__(self, file, atom_style=None, **kwargs):
+        """
+        :param file: the File object of a LAMMPS data file.
+        :param atom_style: str; key of ATOM_STYLES or a tuple of the Atoms columns. By default it is taken
+                           from the comment of the Atoms section, e.g. 'Atoms # full', and is 'full' without one.
+        """
         super().__init__(file, **kwargs)
+
+        self.atom_style = atom_style
+        self.header = dict()  # e.g. "atoms" -> number of atoms, "bond types" -> number of bond types
+        self.bounds = np.zeros((3, 2))
+        self.box_lengths = np.zeros(3)
+        self.tilt = np.zeros(3)  # xy xz yz
+        self.masses = np.zeros(0)  # indexed by atom type
+        self.atoms = dict()  # column -> numpy.array over atoms, in file order
+        self.velocities = dict()
+        self.bonds = np.zeros((0, 4), dtype=np.int64)  # id type atom1 atom2
+        self.angles = np.zeros((0, 5), dtype=np.int64)  # id type atom1 atom2 atom3
+        self.dihedrals = np.zeros((0, 6), dtype=np.int64)  # id type atom1 ... atom4
+        self.impropers = np.zeros((0, 6), dtype=np.int64)
+        self.coeffs = dict()  # section name -> numpy.array, or list of split lines if not all numbers
+        self._atom_rows = None  # atom id -> row in self.atoms
+        self._bond_graph = None
+
+    def parse_file(self, **kwargs):
+        """
+        Read the whole file, decoding each section in bulk.
+        """
+        stream = self.raw_stream()
+        buf = stream.read() if stream is not None else self.file.read().encode()
+        if stream is not None:
+            self.sync_stream(stream)
+        self._atom_rows = None
+        self._bond_graph = None
+
+        pos = buf.find(b'\n') + 1  # the 1st line is a comment
+        in_header = True
+        while 0 < pos < len(buf):
+            end = buf.find(b'\n', pos)
+            end = len(buf) if end == -1 else end + 1
+            line, _, comment = bytes(buf[pos:end]).decode().partition('#')
+            linel = line.split()
+            pos = end
+            if not linel:
+                continue
+            if in_header and re.match(r'[-+.\d]', linel[0]):
+                self.parse_header_line(linel)
+                continue
+
+            in_header = False
+            name = ' '.join(linel)
+            start = BLANK_LINES.match(buf, pos).end()
+            if name in SECTION_COUNTS:
+                pos = self.skip_lines(start, self.header.get(SECTION_COUNTS[name], 0), buf=buf)
+            else:  # up to the next blank line
+                blank = SECTION_END.search(buf, start)
+                pos = blank.start() + 1 if blank is not None else len(buf)
+            self.parse_section(name, comment.strip(), buf[start:pos])
+
+    def parse_header_line(self, linel):
+        if linel[2:4] in (['xlo', 'xhi'], ['ylo', 'yhi'], ['zlo', 'zhi']):
+            dim = 'xyz'.index(linel[2][0])
+            self.bounds[dim] = float(linel[0]), float(linel[1])
+            self.box_lengths[dim] = abs(self.bounds[dim, 1] - self.bounds[dim, 0])
+        elif linel[3:6] == ['xy', 'xz', 'yz']:
+            self.tilt = np.array(linel[:3], dtype=float)
+        else:
+            self.header[' '.join(linel[1:])] = int(linel[0])
+
+    def parse_section(self, name, comment, block):
+        """
+        :param name: str; name of the section, e.g. 'Atoms'.
+        :param comment: str; comment on the name line, e.g. the atom style.
+        :param block: bytes; lines of the section.
+        """
+        if name in SECTION_COUNTS:
+            num_rows = self.header.get(SECTION_COUNTS[name], 0)
+        else:
+            num_rows = len(block.strip().splitlines())
+        if name == 'Atoms':
+            table = self.decode_block(block, num_rows, name)
+            keys = self.atom_keys(comment, table.shape[1])
+            self.atoms = {key: table[:, i].astype(np.int64) if key in INT_KEYS else table[:, i]
+                          for i, key in enumerate(keys)}
+        elif name == 'Velocities':
+            table = self.decode_block(block, num_rows, name)
+            self.velocities = {"id": table[:, 0].astype(np.int64), "vx": table[:, 1], "vy": table[:, 2],
+                               "vz": table[:, 3]}
+        elif name == 'Masses':
+            table = self.decode_block(block, num_rows, name)
+            self.masses = np.full(int(table[:, 0].max(initial=0)) + 1, np.nan)
+            self.masses[table[:, 0].astype(np.int64)] = table[:, 1]
+        elif name in TOPOLOGY_SECTIONS:
+            setattr(self, name.lower(), self.decode_block(block, num_rows, name).astype(np.int64))
+        else:  # coefficients and the other sections
+            try:
+                self.coeffs[name] = self.decode_block(block, num_rows, name)
+            except ValueError:  # style names among the coefficients
+                self.coeffs[name] = self.split_list(bytes(block).decode().strip().splitlines())
+
+    def decode_block(self, block, num_rows, name):
+        """
+        :return: numpy.array, shape=(num_rows, columns); the numbers of a section, decoded in bulk.
+        """
+        block = bytes(block)
+        if b'#' in block:
+            block = re.sub(rb'#[^\n]*', b'', block)
+        if not num_rows:
+            return np.zeros((0, 0))
+        table = np.fromstring(block, sep=' ')
+        if table.size % num_rows or not table.size:
+            raise ValueError("{ClassName} {Name} section does not have {Rows} rows of numbers!".format(
+                ClassName=self.__class__.__name__, Name=name, Rows=num_rows))
+        return table.reshape((num_rows, -1))
+
+    def atom_keys(self, comment, num_columns):
+        """
+        :return: list of str; the columns of the Atoms section, with image flags ix iy iz if present.
+        """
+        style = self.atom_style or (comment.split() or ['full'])[0]
+        if isinstance(style, str):
+            if style not in ATOM_STYLES:
+                raise ValueError("{ClassName} Unknown atom style {Style}, pass the columns as atom_style!".format(
+                    ClassName=self.__class__.__name__, Style=style))
+            style = ATOM_STYLES[style]
+        keys = list(style)
+        if num_columns == len(keys) + 3:
+            keys += ['ix', 'iy', 'iz']
+        if num_columns != len(keys):
+            raise ValueError("{ClassName} Atoms section has {Num} columns, not {Keys}!".format(
+                ClassName=self.__class__.__name__, Num=num_columns, Keys=' '.join(keys)))
+        return keys
+
+    def atom_rows(self, ids):
+        """
+        :param ids: int or numpy.array of atom ids.
+        :return: rows of these atoms in the columns of self.atoms, -1 for unknown ids.
+        """
+        if self._atom_rows is None:
+            atom_ids = self.atoms["id"]
+            self._atom_rows = np.full(int(atom_ids.max(initial=0)) + 1, -1, dtype=np.int64)
+            self._atom_rows[atom_ids] = np.arange(len(atom_ids))
+        ids = np.asarray(ids, dtype=np.int64)
+        known = (ids >= 0) & (ids < len(self._atom_rows))
+        return np.where(known, self._atom_rows[np.where(known, ids, 0)], -1)
+
+    def lookup(self, key, ids):
+        """
+        Column key of the atoms with the given ids, e.g. lookup('mol', atom_info[:, 0]) to attach
+        molecule ids to a dump frame.
+        """
+        rows = self.atom_rows(ids)
+        if (rows < 0).any():
+            raise ValueError("{ClassName} Atom ids not in the data file!".format(ClassName=self.__class__.__name__))
+        return self.atoms[key][rows]
+
+    def bond_graph(self):
+        """
+        Bond adjacency in CSR form over the rows of self.atoms: the atoms bonded to the atom at row i are at
+        rows indices[indptr[i]:indptr[i+1]].
+        :return: indptr, indices; numpy.array.
+        """
+        if self._bond_graph is not None:
+            return self._bond_graph
+        num_atoms = len(self.atoms.get("id", ()))
+        pairs = self.atom_rows(self.bonds[:, 2:4])
+        if (pairs < 0).any():
+            raise ValueError("{ClassName} Bonds between atoms not in the data file!".format(
+                ClassName=self.__class__.__name__))
+        heads = np.concatenate((pairs[:, 0], pairs[:, 1]))
+        tails = np.concatenate((pairs[:, 1], pairs[:, 0]))
+        indices = tails[np.argsort(heads, kind='stable')]
+        indptr = np.zeros(num_atoms + 1, dtype=np.int64)
+        np.cumsum(np.bincount(heads, minlength=num_atoms), out=indptr[1:])
+        self._bond_graph = indptr, indices
+        return self._bond_graph
+
+    def bonded(self, atom_id):
+        """
+        :return: numpy.array of the ids of the atoms bonded to atom atom_id.
+        """
+        indptr, indices = self.bond_graph()
+        row = self.atom_rows(atom_id)
+        return self.atoms["id"][indices[indptr[row]:indptr[row+1]]]
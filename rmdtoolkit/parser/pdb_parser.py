@@ -1,43 +1,161 @@
 # Python 3.6.1
 
-import os
-import copy
-import json
 import numpy as np
 
 from .base import ParserBase
+from .frames import PDBFrame
 
-THIS_DIR = os.path.dirname(__file__)
+PDB_RECORDS = ('ATOM', 'HETATM')
+# Field of PDBFrame -> columns of the ATOM/HETATM records it is read from, counted from 0
+PDB_COLUMNS = {"records": (0, 6), "serials": (6, 11), "atoms": (12, 16), "alt_locs": (16, 17),
+               "res_names": (17, 20), "chain_ids": (21, 22), "res_seqs": (22, 26), "i_codes": (26, 27),
+               "coords": (30, 54), "occupancies": (54, 60), "b_factors": (60, 66), "elements": (76, 78)}
+PDB_WIDTH = 80
 
 
 class PDBParser(ParserBase):
+    frame_marker = b'MODEL'
+    time_pattern = rb'MODEL\s+(-?\d+)'
+
     def __init__(self, file, **kwargs):
-        super().__init__(file, **kwargs)
         """
-        :param path: absolute path of the file to be parsed
-        :param as_df: return as Pandas DataFrame or not
+        Frames are the MODEL/ENDMDL blocks of the file, or the whole file if it has no MODEL record.
+        frame_time is the MODEL serial number, or the number of the frame counted from 1 without one.
         """
+        super().__init__(file, **kwargs)
+
+        self.frame_time = 0
+        self.frame_json = PDBFrame()
+        self.frame_time_list = list()
+        self.frame_json_list = list()
 
-        with open('{}/templates/pdb/pdb_frame.json'.format(THIS_DIR), 'r') as fframe:
-            self.frame_template = json.load(fframe)
+    def read_frame(self):
+        frame = list()
+        status = 0
+        break_trigger = 0  # +1 every time reading 'MODEL', break at 2; the lines before the 1st go with it
 
-        self.frame_json = copy.deepcopy(self.frame_template)
+        while True:
+            if self.read_line() == 1:
+                status = 1
+                break
+            if self.line.startswith('MODEL'):
+                break_trigger += 1
+            if break_trigger > 1:
+                self.file.seek(self.last_pos)
+                break
+            frame.append(self.line)
+        self.frame = frame  # fixed-width lines, not split
+        return status
 
-    def read_frame(self, **kwargs):
-        self.read_lines()
+    def read_frame_bytes(self, stream):
+        buf = super().read_frame_bytes(stream)
+        if buf and not buf.startswith(b'MODEL') and b'\nMODEL' not in buf:  # lines before the 1st MODEL
+            buf += super().read_frame_bytes(stream)
+        return buf
+
+    def find_frame_end(self, start):
+        end = super().find_frame_end(start)
+        header = self._mmap[start:start+5] != b'MODEL' and self._mmap.find(b'\nMODEL', start, end) == -1
+        if header and end < len(self._mmap):  # lines before the 1st MODEL
+            end = super().find_frame_end(end)
+        return end
 
     def parse_frame(self, **kwargs):
-        self.frame = list(map(lambda string: string.strip('\n'), self.frame))
-        self.frame = np.array(self.frame)[list(map(lambda string: string.startswith('ATOM'), self.frame))]
-
-        self.frame_json["atoms"] = np.array(list(map(lambda string: string[13:16].strip(' '), self.frame)))
-        self.frame_json["elements"] = np.array(list(map(lambda string: string[76:78].strip(' '), self.frame)))
-        self.frame_json["res_names"] = np.array(list(map(lambda string: string[17:20].strip(' '), self.frame)))
-        self.frame_json["chain_ids"] = np.array(list(map(lambda string: string[21:22].strip(' '), self.frame)))
-        self.frame_json["res_seqs"] = np.array(list(map(lambda string: string[22:26].strip(' '), self.frame)))
-        self.frame_json["coords"] = np.array(list(map(lambda string: list(map(float, string[30:54].split())),
-                                                      self.frame)))
-
-    def parse_file(self, **kwargs):
-        self.read_frame()
-        self.parse_frame()
+        self.decode_frame(''.join(self.frame).encode(), **kwargs)
+
+    def decode_frame(self, buf, records=PDB_RECORDS, block_lines=1 << 14):
+        """
+        Parse a frame from its raw bytes. The records are cut into a character table of fixed-width rows
+        and every field is decoded from its columns at once, block_lines lines at a time.
+        :param buf: bytes-like; lines of the frame.
+        :param records: iterable of str; the records to read, e.g. ('ATOM',) to skip HETATM.
+        :param block_lines: int; number of lines decoded at a time, bounding the memory used.
+        """
+        buf = bytes(buf)
+        model = 0 if buf.startswith(b'MODEL') else buf.find(b'\nMODEL')
+        model_line = buf[model:buf.find(b'\n', model + 1)].split() if model != -1 else list()
+        self.frame_time = int(model_line[1]) if len(model_line) > 1 else self.frame_time + 1
+
+        chars = np.frombuffer(buf + b' ' * PDB_WIDTH, dtype=np.uint8)  # padded, so rows never run past the end
+        ends = np.flatnonzero(chars[:len(buf)] == ord('\n'))
+        if len(buf) and buf[-1:] != b'\n':
+            ends = np.append(ends, len(buf))
+        starts = np.append(0, ends[:-1] + 1)
+        wanted = np.array([_.encode().ljust(6) for _ in records], dtype='S6')
+
+        blocks = list()
+        for i in range(0, len(starts), block_lines):
+            heads = self.fixed_width(chars, starts[i:i+block_lines], ends[i:i+block_lines], 6)
+            keep = np.isin(heads.view('S6').ravel(), wanted)
+            table = self.fixed_width(chars, starts[i:i+block_lines][keep], ends[i:i+block_lines][keep], PDB_WIDTH)
+            blocks.append(self.decode_records(table))
+
+        self.frame_json = PDBFrame(model=self.frame_time)
+        for key in PDB_COLUMNS:
+            self.frame_json[key] = np.concatenate([_[key] for _ in blocks]) if blocks else self.frame_json[key]
+
+    @staticmethod
+    def fixed_width(chars, starts, ends, width):
+        """
+        :param chars: numpy.array of uint8; the padded buffer.
+        :return: numpy.array of uint8, shape=(len(starts), width); the lines, blank past their ends.
+        """
+        columns = starts[:, None] + np.arange(width)
+        table = chars[columns]
+        table[columns >= ends[:, None]] = ord(' ')
+        return table
+
+    def decode_records(self, table):
+        """
+        :param table: numpy.array of uint8, shape=(records, PDB_WIDTH).
+        :return: dict; field -> numpy.array over the records.
+        """
+        fields = dict()
+        for key, (start, stop) in PDB_COLUMNS.items():
+            columns = np.ascontiguousarray(table[:, start:stop])
+            if key == 'serials':
+                try:
+                    fields[key] = self.decode_numbers(columns[:, None, :])[:, 0].astype(np.int64)
+                except ValueError:  # hexadecimal or ***** serials of very large structures
+                    fields[key] = np.full(len(table), -1, dtype=np.int64)
+            elif key in ('occupancies', 'b_factors'):
+                fields[key] = self.decode_numbers(columns[:, None, :])[:, 0]
+            elif key == 'coords':
+                fields[key] = self.decode_numbers(columns.reshape((len(table), 3, 8)))
+            else:
+                fields[key] = np.char.strip(columns.view('S{}'.format(stop - start)).ravel()).astype(str)
+        return fields
+
+    def decode_numbers(self, columns):
+        """
+        :param columns: numpy.array of uint8, shape=(records, fields, width); fixed-width numbers that may
+                        run into each other. Blank fields are read as 0.
+        :return: numpy.array, shape=(records, fields)
+        """
+        shape = columns.shape[:2]
+        columns = np.concatenate((columns, np.full(shape + (1,), ord(' '), dtype=np.uint8)), axis=2)
+        columns[..., -2][(columns == ord(' ')).all(axis=2)] = ord('0')
+        try:
+            numbers = np.fromstring(columns.tobytes(), sep=' ') if columns.size else np.zeros(0)
+        except ValueError:  # raised by newer numpy, older ones stop short
+            numbers = np.zeros(0)
+        if numbers.size != shape[0] * shape[1]:
+            raise ValueError("{ClassName} Unreadable numbers in the records of frame {Time}!".format(
+                ClassName=self.__class__.__name__, Time=self.frame_time))
+        return numbers.reshape(shape)
+
+    def iter_frames(self, start=0, stop=None, stride=1, bulk=True, **kwargs):
+        """
+        :param bulk: bool; read frames as raw bytes when the file allows.
+        See ParserBase.iter_frames for the other parameters.
+        """
+        yield from super().iter_frames(start=start, stop=stop, stride=stride, raw=bulk, **kwargs)
+
+    def parse_file(self, debug=None, **kwargs):
+        """
+        :param debug: int; only parse the first debug frames.
+        After parsing, frame_json is the last frame, i.e. the whole structure of a file without MODEL records.
+        """
+        for frame_json in self.iter_frames(stop=debug or None, **kwargs):
+            self.frame_time_list.append(self.frame_time)
+            self.frame_json_list.append(frame_json)
@@ -0,0 +1,93 @@
+# Python 3.6.1
+
+import copy
+import collections
+import numpy as np
+
+
+class Trajectory(object):
+    def __init__(self, parser, cache_size=16, **kwargs):
+        """
+        Lazy sequence of the frames of a trajectory file; a frame is only decoded when it is accessed.
+        Supports len(traj), traj[n], traj[start:stop:step] and traj.time_slice(t0, t1); slices are lazy too.
+        :param parser: DumpParser, XYZParser or EVBParser of a file on disk. XYZ files must not be compressed.
+        :param cache_size: int; number of recently decoded frames kept.
+        :param kwargs: passed to parser.decode_frame().
+        """
+        self.parser = parser
+        self.cache_size = cache_size
+        self.kwargs = kwargs
+
+        if parser.frame_marker is not None:
+            index = parser.build_index()
+            self._offsets = np.append(index.offsets, index.end)
+            self._times = index.times
+        else:  # XYZ, frame time is the number of the frame counted from 1
+            parser.file.seek(0)
+            offsets = [0]
+            for _ in parser.iter_frame_buffers():
+                offsets.append(parser.current_pos)
+            self._offsets = np.array(offsets, dtype=np.int64)
+            self._times = np.arange(1, len(offsets), dtype=np.int64)
+
+        try:
+            self._view = memoryview(parser.map_file())
+            self._stream = None
+        except ValueError:  # compressed file, read frames from the decompressed stream
+            self._view = None
+            self._stream = parser.raw_stream()
+        self._cache = collections.OrderedDict()
+        self._frames = range(len(self._times))
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self._select(self._frames[key])
+        return self._decode(self._frames[key])
+
+    def __iter__(self):
+        for n in self._frames:
+            yield self._decode(n)
+
+    @property
+    def times(self):
+        """
+        :return: numpy.array; timesteps of the frames in this trajectory.
+        """
+        return self._times[np.arange(self._frames.start, self._frames.stop, self._frames.step)]
+
+    def time_slice(self, t0, t1):
+        """
+        :return: Trajectory of the frames with t0 <= time <= t1; timesteps are assumed to be increasing.
+        """
+        times = self.times
+        first = int(np.searchsorted(times, t0, side='left'))
+        last = int(np.searchsorted(times, t1, side='right'))
+        return self._select(self._frames[first:max(first, last)])
+
+    def _select(self, frames):
+        view = copy.copy(self)  # shares the parser, offsets and cache
+        view._frames = frames
+        return view
+
+    def _decode(self, n):
+        if n in self._cache:
+            self._cache.move_to_end(n)
+            return self._cache[n]
+
+        start, stop = self._offsets[n], self._offsets[n+1]
+        if self._view is not None:
+            buf = self._view[start:stop]
+        else:
+            self._stream.seek(start)
+            buf = self._stream.read(stop - start)
+        self.parser.decode_frame(buf, **self.kwargs)
+        self.parser.frame_time = int(self._times[n])
+        frame_json = self.parser.frame_json
+
+        self._cache[n] = frame_json
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return frame_json
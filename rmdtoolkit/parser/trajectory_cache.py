@@ -0,0 +1,116 @@
+# Python 3.6.1
+
+import os
+import json
+import numpy as np
+
+from .frames import DumpFrame
+
+
+class TrajectoryCache(object):
+    def __init__(self, path):
+        """
+        Binary columnar copy of a trajectory, with arrays memory-mapped so frames are only read when sliced.
+        :param path: str; directory written by TrajectoryCache.convert.
+        """
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), 'r') as meta_file:
+            self.meta = json.load(meta_file)
+        self.atom_keys = self.meta["atom_keys"]
+
+        self.positions = np.load(os.path.join(path, 'positions.npy'), mmap_mode='r')  # frames x atoms x columns
+        self.times = np.load(os.path.join(path, 'times.npy'))
+        self.bounds = np.load(os.path.join(path, 'bounds.npy'))
+        self.atoms = None  # atom names, XYZ only
+        if os.path.isfile(os.path.join(path, 'atoms.npy')):
+            self.atoms = np.load(os.path.join(path, 'atoms.npy'))
+
+    def __len__(self):
+        return len(self.times)
+
+    def column(self, key):
+        """
+        :return: numpy.array, shape=(frames, atoms); a view of column key of every frame.
+        """
+        return self.positions[:, :, self.atom_keys.index(key)]
+
+    def frame(self, n):
+        """
+        :return: DumpFrame of frame n.
+        """
+        bounds = self.bounds[n]
+        return DumpFrame(time=int(self.times[n]), num_atoms=self.positions.shape[1], bounds=bounds,
+                         box_lengths=np.abs(bounds[:, 1] - bounds[:, 0]), atom_keys=list(self.atom_keys),
+                         atom_info=self.positions[n])
+
+    @classmethod
+    def convert(cls, parser, path, start=0, stop=None, stride=1, dtype=np.float64, **kwargs):
+        """
+        Parse a trajectory once and write it as a binary columnar cache.
+        :param parser: DumpParser or XYZParser positioned at the first frame to convert; its file may be compressed,
+                       see open_trajectory.
+        :param path: str; directory to write the cache into.
+        :param start, stop, stride: int; frames to convert, counted from the current position of the parser.
+        :param dtype: numpy.dtype of the stored positions.
+        :param kwargs: passed to parser.iter_frames().
+        :return: TrajectoryCache of the written cache.
+        """
+        os.makedirs(path, exist_ok=True)
+        num_frames = len(range(cls._count_frames(parser))[start:stop:stride])
+
+        positions = None
+        times = np.zeros(num_frames, dtype=np.int64)
+        bounds = np.full((num_frames, 3, 2), np.nan)
+        meta = {"source": getattr(parser.file, 'name', None), "parser": parser.__class__.__name__}
+        for i, frame_json in enumerate(parser.iter_frames(start=start, stop=stop, stride=stride, **kwargs)):
+            if "atom_info" in frame_json:
+                atom_info = frame_json["atom_info"]
+                times[i] = frame_json["time"]
+                bounds[i] = frame_json["bounds"]
+            else:
+                atom_info = frame_json["coords"]
+                times[i] = parser.frame_time
+
+            if positions is None:
+                if "atom_info" in frame_json:
+                    meta["atom_keys"] = list(frame_json["atom_keys"])
+                else:
+                    meta["atom_keys"] = ['x', 'y', 'z']
+                    np.save(os.path.join(path, 'atoms.npy'), np.asarray(frame_json["atoms"]))
+                positions = np.lib.format.open_memmap(os.path.join(path, 'positions.npy'), mode='w+', dtype=dtype,
+                                                      shape=(num_frames,) + np.shape(atom_info))
+            if np.shape(atom_info) != positions.shape[1:]:
+                raise ValueError("{ClassName} Frame {Time} does not have the same atoms as the first frame!".format(
+                    ClassName=cls.__name__, Time=times[i]))
+            positions[i] = atom_info
+
+        if positions is None:
+            raise ValueError("{ClassName} No frame to convert!".format(ClassName=cls.__name__))
+        positions.flush()
+        del positions
+        np.save(os.path.join(path, 'times.npy'), times)
+        np.save(os.path.join(path, 'bounds.npy'), bounds)
+        with open(os.path.join(path, 'meta.json'), 'w') as meta_file:
+            json.dump(meta, meta_file)
+        return cls(path)
+
+    @staticmethod
+    def _count_frames(parser):
+        # Frames left from the current position, found without decoding them
+        pos = parser.file.tell()
+        frame_time = parser.frame_time
+        if parser.frame_index is not None:
+            num_frames = len(parser.frame_index) - int(np.searchsorted(parser.frame_index.offsets, pos))
+        else:
+            try:
+                num_frames = sum(1 for _ in parser.iter_frame_buffers())
+            except ValueError:  # compressed file, read through the decompressed stream instead
+                stream = parser.raw_stream()
+                if stream is not None:
+                    num_frames = sum(1 for _ in parser.iter_stream_buffers(stream))
+                else:
+                    num_frames = sum(1 for _ in parser.iter_frames())
+        parser.file.seek(pos)
+        parser.current_pos = pos
+        parser.frame_time = frame_time
+        return num_frames
@@ -1,24 +1,17 @@
 # Python 3.6.1
 
-import os
-import copy
-import json
 import numpy as np
 
 from .base import ParserBase
-
-THIS_DIR = os.path.dirname(__file__)
+from .frames import XYZFrame
 
 
 class XYZParser(ParserBase):
     def __init__(self, file, process_comment=False, **kwargs):
         super().__init__(file, **kwargs)
 
-        with open('{}/templates/xyz/xyz_frame.json'.format(THIS_DIR), 'r') as fframe:
-            self.frame_template = json.load(fframe)
-
         self.frame_time = 0
-        self.frame_json = copy.deepcopy(self.frame_template)
+        self.frame_json = XYZFrame()
         self.frame_json_list = list()
         self.frame_comment_list = list()
         self.frame_time_list = list()
@@ -46,8 +39,21 @@ class XYZParser(ParserBase):
         self.frame = self.split_list(frame)
         return status
 
+    def read_frame_bytes(self, stream):
+        head = stream.readline()
+        if not head.strip():
+            return b''
+        return head + stream.readline() + self.read_lines_bytes(stream, int(head))
+
+    def find_frame_end(self, start):
+        num_atoms = int(self._mmap[start:self._mmap.find(b'\n', start)])
+        return self.skip_lines(start, num_atoms + 2)
+
+    def count_frames(self, num_frames):
+        self.frame_time += num_frames  # XYZ has no timestep, count the frames read instead
+
     def parse_frame(self, **kwargs):
-        self.frame_json = copy.deepcopy(self.frame_template)
+        self.frame_json = XYZFrame()
 
         for i, linel in enumerate(self.frame):
             if not linel:
@@ -56,22 +62,15 @@ class XYZParser(ParserBase):
             if i == 0:
                 self.frame_json["num_atoms"] = int(linel[0])
             elif i == 1:
-                comment = ' '.join(linel)
                 self.frame_json["comment"] = ' '.join(linel)
-                self.frame_comment_list.append(comment)
             else:
                 info = np.array(self.frame[i:])
                 self.frame_json["atoms"] = info[:, 0].astype(str)
                 self.frame_json["coords"] = info[:, 1:4].astype(float)
                 break
 
-    def parse_file(self, **kwargs):
-        while True:
-            status = self.read_frame()
-            if status == 1:
-                break
-            self.frame_time += 1
-            self.time_tell()
-            self.parse_frame(**kwargs)
-            self.frame_json_list.append(copy.deepcopy(self.frame_json))
-
+    def parse_file(self, debug=None, **kwargs):
+        for frame_json in self.iter_frames(stop=debug or None, **kwargs):
+            self.frame_time_list.append(self.frame_time)
+            self.frame_comment_list.append(frame_json["comment"])
+            self.frame_json_list.append(frame_json)